@@ -3,85 +3,165 @@ Enhanced Chat Engine for Sundew Solutions
 Handles all AI processing, document retrieval, and response generation
 """
 
+import asyncio
 import os
+import queue
+import threading
+from functools import lru_cache
+from typing import Iterator, List
+
 import streamlit as st
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer, util
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.documents import Document
-from langchain.memory import ConversationBufferMemory
+from langchain_core.retrievers import BaseRetriever
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
 from langchain.chains import ConversationalRetrievalChain
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.chat_models import ChatOpenAI
 from dotenv import load_dotenv
 
-from utils.document_processor import DocumentProcessor
+from utils.document_processor import get_document_processor
 from utils.intent_detector import IntentDetector
+from utils.models import get_chat_llm, get_classifier, get_embedder
 from utils.response_enhancer import ResponseEnhancer
 
 load_dotenv()
 
+@lru_cache(maxsize=1024)
+def _embed_query(text: str, model_name: str, backend: str = 'torch', quantization: str = None):
+    """Embed a user query once; repeated questions skip the forward pass"""
+    embedding = get_embedder(model_name, backend, quantization).encode(text, normalize_embeddings=True)
+    embedding.setflags(write=False)  # Shared across cache hits
+    return embedding
+
+
+class _StaticRetriever(BaseRetriever):
+    """Retriever that returns a prebuilt document list without re-embedding; docs are replaced each turn"""
+    
+    docs: List[Document] = []
+    
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.docs
+
+
+class _TokenQueueHandler(BaseCallbackHandler):
+    """Forwards streamed LLM tokens to a queue consumed by the UI thread"""
+    
+    def __init__(self, token_queue):
+        self.token_queue = token_queue
+    
+    def on_llm_new_token(self, token, **kwargs):
+        self.token_queue.put(token)
+
+
+_STREAM_END = object()
+
+
+async def _run_in_thread(func, *args):
+    """Run a blocking call in a worker thread that can still write to the Streamlit page"""
+    ctx = get_script_run_ctx()
+    
+    def call():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args)
+    
+    return await asyncio.to_thread(call)
+
+
 class ChatEngine:
     """Main chat processing engine"""
     
     def __init__(self, config):
         self.config = config
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        self.last_response = None
         self.setup_models()
-        self.document_processor = DocumentProcessor(config)
+        self.memory = self._build_memory()
+        self._retriever = _StaticRetriever()
+        self._chain = self._build_chain()
+        self.document_processor = get_document_processor(config)
         self.intent_detector = IntentDetector(config)
         self.response_enhancer = ResponseEnhancer(config)
         
     def setup_models(self):
-        """Initialize AI models"""
+        """Attach the shared AI models; weights are loaded once per process"""
         os.environ["TRANSFORMERS_NO_TF"] = "1"
         
+        backend = self.config.get('inference_backend', 'torch')
+        
         # Intent classification model
-        self.classifier = pipeline(
-            "zero-shot-classification", 
-            model="valhalla/distilbart-mnli-12-1"
+        self.classifier = get_classifier(
+            self.config['intent_model'], backend,
+            self.config.get('compile_intent_model', False), self.config.get('quantize_intent_model', False)
         )
         
         # Embedding model for document similarity
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
+        quantization = self.config.get('embedding_quantization') if backend == 'onnx' else None
+        self._embedder_args = (self.config['embedding_model'], backend, quantization)
+        self.embedder = get_embedder(*self._embedder_args)
         
-        # LLM for response generation
-        api_key = os.getenv("OPENAI_API_KEY")
-        if api_key:
-            self.llm = ChatOpenAI(
-                model_name="gpt-4",
-                temperature=0.2,
-                openai_api_key=api_key
-            )
-        else:
+        # LLM for response generation; answers stream token by token, while
+        # question condensing and history summaries use a non-streaming twin
+        model_name = self.config.get('openai_model', 'gpt-4')
+        temperature = self.config.get('openai_temperature', 0.2)
+        self.llm = get_chat_llm(model_name, temperature, streaming=True)
+        self.helper_llm = get_chat_llm(model_name, temperature)
+        if self.llm is None:
             st.warning("OpenAI API key not found. Some features may be limited.")
-            self.llm = None
     
-    def process_user_input(self, user_input: str, user_data: dict = None) -> str:
+    def _build_memory(self):
+        """Conversation memory; older turns are summarized once past the token limit"""
+        if self.llm is None:
+            return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        
+        return ConversationSummaryBufferMemory(
+            llm=self.helper_llm,
+            max_token_limit=self.config.get('memory_max_tokens', 512),
+            memory_key="chat_history",
+            return_messages=True
+        )
+    
+    def _build_chain(self):
+        """Build the RAG chain once; each turn swaps documents into its retriever"""
+        if self.llm is None:
+            return None
+        
+        # Memory is managed by process_user_input rather than the chain, so
+        # history records the user's words instead of the enhanced prompt
+        return ConversationalRetrievalChain.from_llm(
+            llm=self.llm,
+            retriever=self._retriever,
+            condense_question_llm=self.helper_llm
+        )
+    
+    def process_user_input(self, user_input: str, user_data: dict = None) -> Iterator[str]:
         """
-        Main method to process user input and generate response
+        Main method to process user input and stream the generated response
         
         Args:
             user_input: The user's question/message
             user_data: Additional user context (email, name, etc.)
             
-        Returns:
-            Generated response string
+        Yields:
+            Response text chunks as they are generated. Once the generator is
+            exhausted, last_response holds the final enhanced response.
         """
+        self.last_response = None
         try:
-            # Detect user intent and relevant categories
-            intents = self.intent_detector.detect_intents(user_input)
+            # Detect intents and embed the query concurrently; the embedding
+            # is shared with ranking and retrieval
+            intents, q_emb = asyncio.run(self._gather_query_context(user_input))
+            self.intent_detector.render_intent_debug(intents)
             
             # Find and rank relevant documents
             matched_docs = self.document_processor.rank_documents(
                 user_input, 
                 intents.get('folders', []),
-                top_k=3
+                top_k=3,
+                query_embedding=q_emb
             )
             
-            if matched_docs and self.llm:
-                # Create retriever from matched documents
-                retriever = self._build_temp_retriever(matched_docs)
+            if matched_docs and self._chain:
+                # Point the chain's retriever at the matched documents
+                self._retriever.docs = self._select_context_docs(matched_docs)
                 
                 # Build enhanced prompt
                 enhanced_prompt = self.response_enhancer.build_professional_prompt(
@@ -89,41 +169,63 @@ class ChatEngine:
                 )
                 
                 # Generate response using RAG chain
-                chain = ConversationalRetrievalChain.from_llm(
-                    llm=self.llm,
-                    retriever=retriever,
-                    memory=self.memory
-                )
-                
-                response = chain.run({
+                response = yield from self._stream_chain(self._chain, {
                     "question": enhanced_prompt, 
-                    "chat_history": self.memory.chat_memory.messages
+                    "chat_history": self.memory.load_memory_variables({})["chat_history"]
                 })
+                self.memory.save_context({"question": user_input}, {"answer": response})
                 
                 # Enhance response with company-specific elements
-                enhanced_response = self.response_enhancer.enhance_response(
+                self.last_response = self.response_enhancer.enhance_response(
                     response, intents, user_data
                 )
-                
-                return enhanced_response
             else:
                 # Fallback response with helpful guidance
-                return self._generate_fallback_response(intents, user_data)
+                self.last_response = self._generate_fallback_response(intents, user_data)
+                yield self.last_response
                 
         except Exception as e:
             st.error(f"Error processing input: {str(e)}")
-            return "I apologize, but I encountered an error. Please try rephrasing your question."
+            self.last_response = "I apologize, but I encountered an error. Please try rephrasing your question."
+            yield self.last_response
+    
+    async def _gather_query_context(self, user_input):
+        """Run intent detection and query embedding side by side"""
+        return await asyncio.gather(
+            _run_in_thread(self.intent_detector.detect_intents, user_input),
+            _run_in_thread(_embed_query, user_input, *self._embedder_args)
+        )
     
-    def _build_temp_retriever(self, matched_docs):
-        """Build temporary FAISS retriever from documents"""
+    def _stream_chain(self, chain, inputs):
+        """Run the chain in a worker thread, yielding answer tokens as they arrive; returns the full answer"""
+        token_queue = queue.Queue()
+        outcome = {}
+        
+        def run_chain():
+            try:
+                result = chain.invoke(inputs, config={"callbacks": [_TokenQueueHandler(token_queue)]})
+                outcome['answer'] = result['answer']
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                token_queue.put(_STREAM_END)
+        
+        threading.Thread(target=run_chain, daemon=True).start()
+        
+        while (token := token_queue.get()) is not _STREAM_END:
+            yield token
+        
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['answer']
+    
+    def _select_context_docs(self, matched_docs):
+        """Wrap the ranked matches as the chain's context documents"""
         langchain_docs = [
-            Document(page_content=doc_text, metadata={"source": fname}) 
-            for _, fname, doc_text in matched_docs
+            Document(page_content=content, metadata={"source": filename}) 
+            for _, filename, content, _ in matched_docs
         ]
-        
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        temp_faiss = FAISS.from_documents(langchain_docs, embedding=embeddings)
-        return temp_faiss.as_retriever()
+        return langchain_docs
     
     def _generate_fallback_response(self, intents, user_data=None):
         """Generate helpful fallback response when no documents match"""
@@ -38,7 +38,7 @@ def main():
     # Initialize session manager
     if 'session_manager' not in st.session_state:
         st.session_state.session_manager = SessionManager()
-        logger.info(f"New session started: {st.session_state.session_manager.session_id}")
+        logger.info("New session started: %s", st.session_state.session_manager.session_id)
     
     # Initialize chat engine
     if 'chat_engine' not in st.session_state:
@@ -2,16 +2,56 @@
 Enhanced Session Manager with analytics and logging
 """
 
-import json
+import orjson
 import uuid
 import csv
 import os
+import re
+import threading
+import weakref
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
 
+# Buffered analytics events are written once this many have accumulated
+ANALYTICS_FLUSH_SIZE = 32
+
+CSV_LOG_FILE = "chat_history.csv"
+CSV_LOG_HEADER = [
+    'timestamp', 'session_id', 'email', 'user_type', 'user_intent', 
+    'conversation_turns', 'session_duration', 'final_status',
+    'topics_discussed', 'business_email', 'engaged'
+]
+
+# Summary terms: intent keywords map to their intent, topics map to themselves
+INTENT_TERMS = {
+    'service': 'service_inquiry', 'solution': 'service_inquiry',
+    'career': 'career_inquiry', 'job': 'career_inquiry',
+    'about': 'company_info', 'company': 'company_info'
+}
+TOPICS = ['ai', 'automation', 'web', 'mobile', 'cloud', 'design']
+
+# Lookahead so overlapping terms are all found, matching plain substring checks
+_TERM_RE = re.compile('(?=(' + '|'.join(list(INTENT_TERMS) + TOPICS) + '))')
+
+def _write_analytics(buffer):
+    """Append buffered (file, line) analytics entries, opening each file once"""
+    by_file = {}
+    for analytics_file, line in buffer:
+        by_file.setdefault(analytics_file, []).append(line)
+    buffer.clear()
+    
+    for analytics_file, lines in by_file.items():
+        with open(analytics_file, 'ab') as f:
+            f.writelines(lines)
+
 class SessionManager:
     """Enhanced session manager with analytics and logging capabilities"""
     
+    # Whether the shared CSV log has its header; checked on disk once per process
+    _csv_header_written = None
+    _csv_header_lock = threading.Lock()
+    
     def __init__(self):
         self.session_id = f"sess_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
         self.conversation = []
@@ -20,6 +60,24 @@ class SessionManager:
         self.session_start = datetime.now()
         self.last_activity = datetime.now()
         
+        # Running totals maintained by add_turn so stats and summaries
+        # never rescan the conversation
+        self._user_count = 0
+        self._bot_count = 0
+        self._user_chars = 0
+        self._bot_chars = 0
+        self._intent_counts = Counter()
+        self._topics_mentioned = []
+        
+        # Analytics events are buffered in memory; the finalizer flushes
+        # whatever is left when the session is collected or the process exits
+        self._analytics_buffer = []
+        weakref.finalize(self, _write_analytics, self._analytics_buffer)
+        
+        # CSV log handle, opened on first save and kept for the session
+        self._csv_handle = None
+        self._csv_writer = None
+        
         # Create necessary directories
         self._create_directories()
         
@@ -56,6 +114,14 @@ class SessionManager:
         self.counter += 1
         self.last_activity = datetime.now()
         
+        if user:
+            self._user_count += 1
+            self._user_chars += len(user)
+            self._track_topics(user)
+        if bot:
+            self._bot_count += 1
+            self._bot_chars += len(bot)
+        
         # Log turn for analytics
         self._log_turn_analytics(turn_data)
     
@@ -85,15 +151,12 @@ class SessionManager:
         if not self.conversation:
             return {}
         
-        user_messages = [turn for turn in self.conversation if turn.get('user')]
-        bot_messages = [turn for turn in self.conversation if turn.get('bot')]
-        
         stats = {
             'total_turns': len(self.conversation),
-            'user_messages': len(user_messages),
-            'bot_messages': len(bot_messages),
-            'avg_user_message_length': sum(len(turn.get('user', '')) for turn in user_messages) / len(user_messages) if user_messages else 0,
-            'avg_bot_message_length': sum(len(turn.get('bot', '')) for turn in bot_messages) / len(bot_messages) if bot_messages else 0,
+            'user_messages': self._user_count,
+            'bot_messages': self._bot_count,
+            'avg_user_message_length': self._user_chars / self._user_count if self._user_count else 0,
+            'avg_bot_message_length': self._bot_chars / self._bot_count if self._bot_count else 0,
             'session_duration_minutes': self.get_session_duration(),
             'messages_per_minute': len(self.conversation) / max(self.get_session_duration(), 1)
         }
@@ -108,19 +171,25 @@ class SessionManager:
             "session_start": self.session_start.isoformat(),
             "session_duration_minutes": self.get_session_duration(),
             "user": self.user_data,
-            "conversation": self.conversation,
+            "conversation": [  # Without private keys cached on turns
+                {key: value for key, value in turn.items() if not key.startswith('_')}
+                for turn in self.conversation
+            ],
             "stats": self.get_conversation_stats(),
             "summary": self._generate_conversation_summary()
         }
         
         # Save JSON log
         log_file = f"chat_logs/{self.session_id}.json"
-        with open(log_file, "w", encoding='utf-8') as f:
-            json.dump(log_data, f, indent=2, ensure_ascii=False)
+        with open(log_file, "wb") as f:
+            f.write(orjson.dumps(log_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         
         # Append to CSV for easy analysis
         self._append_to_csv_log(log_data)
         
+        # Saving ends the logged session, so persist buffered analytics too
+        self._flush_analytics()
+        
         return log_file
     
     def _generate_conversation_summary(self):
@@ -128,27 +197,11 @@ class SessionManager:
         if not self.conversation:
             return "No conversation"
         
-        user_intents = []
-        topics_mentioned = []
-        
-        for turn in self.conversation:
-            user_msg = turn.get('user', '').lower()
-            if 'service' in user_msg or 'solution' in user_msg:
-                user_intents.append('service_inquiry')
-            if 'career' in user_msg or 'job' in user_msg:
-                user_intents.append('career_inquiry')
-            if 'about' in user_msg or 'company' in user_msg:
-                user_intents.append('company_info')
-            
-            # Extract topics
-            topics = ['ai', 'automation', 'web', 'mobile', 'cloud', 'design']
-            for topic in topics:
-                if topic in user_msg and topic not in topics_mentioned:
-                    topics_mentioned.append(topic)
+        primary_intent = self._intent_counts.most_common(1)
         
         summary = {
-            'primary_intent': max(set(user_intents), key=user_intents.count) if user_intents else 'general',
-            'topics_discussed': topics_mentioned,
+            'primary_intent': primary_intent[0][0] if primary_intent else 'general',
+            'topics_discussed': list(self._topics_mentioned),
             'conversation_type': self.user_data.get('user_type', 'unknown'),
             'engaged': len(self.conversation) > 5,
             'business_email_provided': self.user_data.get('email') and '@' in str(self.user_data.get('email', '')),
@@ -158,6 +211,20 @@ class SessionManager:
         
         return summary
     
+    def _track_topics(self, user_msg):
+        """Update intent counts and first-mention topic order from a user message"""
+        found = {m.group(1) for m in _TERM_RE.finditer(user_msg.lower())}
+        if not found:
+            return
+        
+        # Each intent counts once per message, however many of its terms appear
+        self._intent_counts.update({INTENT_TERMS[t] for t in found if t in INTENT_TERMS})
+        
+        # Extract topics
+        for topic in TOPICS:
+            if topic in found and topic not in self._topics_mentioned:
+                self._topics_mentioned.append(topic)
+    
     def _determine_final_status(self):
         """Determine the final status of the conversation"""
         if not self.conversation:
@@ -178,34 +245,39 @@ class SessionManager:
     
     def _append_to_csv_log(self, log_data):
         """Append session data to CSV for analytics"""
-        csv_file = "chat_history.csv"
-        file_exists = os.path.exists(csv_file)
+        writer = self._get_csv_writer()
         
-        with open(csv_file, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            # Write header if file doesn't exist
-            if not file_exists:
-                writer.writerow([
-                    'timestamp', 'session_id', 'email', 'user_type', 'user_intent', 
-                    'conversation_turns', 'session_duration', 'final_status',
-                    'topics_discussed', 'business_email', 'engaged'
-                ])
+        summary = log_data['summary']
+        writer.writerow([
+            log_data['timestamp'],
+            log_data['session_id'],
+            self.user_data.get('email', ''),
+            self.user_data.get('user_type', ''),
+            summary['primary_intent'],
+            len(self.conversation),
+            round(log_data['session_duration_minutes'], 2),
+            summary['final_status'],
+            ','.join(summary['topics_discussed']),
+            summary['business_email_provided'],
+            summary['engaged']
+        ])
+        self._csv_handle.flush()
+    
+    def _get_csv_writer(self):
+        """Open the CSV log once per session, writing the header if the file is new"""
+        if self._csv_writer is None:
+            self._csv_handle = open(CSV_LOG_FILE, 'a', newline='', encoding='utf-8', buffering=8192)
+            weakref.finalize(self, self._csv_handle.close)
+            self._csv_writer = csv.writer(self._csv_handle)
             
-            summary = log_data['summary']
-            writer.writerow([
-                log_data['timestamp'],
-                log_data['session_id'],
-                self.user_data.get('email', ''),
-                self.user_data.get('user_type', ''),
-                summary['primary_intent'],
-                len(self.conversation),
-                round(log_data['session_duration_minutes'], 2),
-                summary['final_status'],
-                ','.join(summary['topics_discussed']),
-                summary['business_email_provided'],
-                summary['engaged']
-            ])
+            with SessionManager._csv_header_lock:
+                if SessionManager._csv_header_written is None:
+                    SessionManager._csv_header_written = os.path.getsize(CSV_LOG_FILE) > 0
+                if not SessionManager._csv_header_written:
+                    self._csv_writer.writerow(CSV_LOG_HEADER)
+                    SessionManager._csv_header_written = True
+        
+        return self._csv_writer
     
     def _log_turn_analytics(self, turn_data):
         """Log individual turn for real-time analytics"""
@@ -221,10 +293,17 @@ class SessionManager:
         self._append_to_analytics(analytics_entry)
     
     def _append_to_analytics(self, entry):
-        """Append entry to analytics log"""
+        """Buffer entry for the analytics log, flushing in batches"""
         analytics_file = f"analytics/daily_{datetime.now().strftime('%Y%m%d')}.jsonl"
-        with open(analytics_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(entry) + '\n')
+        self._analytics_buffer.append((analytics_file, orjson.dumps(entry) + b'\n'))
+        
+        if len(self._analytics_buffer) >= ANALYTICS_FLUSH_SIZE:
+            self._flush_analytics()
+    
+    def _flush_analytics(self):
+        """Write all buffered analytics entries to disk"""
+        if self._analytics_buffer:
+            _write_analytics(self._analytics_buffer)
     
     def export_conversation_text(self):
         """Export conversation as readable text"""
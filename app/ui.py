@@ -4,22 +4,65 @@ Implements guided flows, service promotion, and personalized experience
 """
 
 import streamlit as st
-import re
 from datetime import datetime
-from utils.validation import validate_email, is_business_email
+from utils.validation import parse_email
 from utils.guided_flows import GuidedFlows
 
-def display_chat_ui(chat_engine, session_manager, config):
-    """Main chat interface with enhanced features"""
-    
-    # Header with company branding
-    st.markdown("""
+# Static page content, built once at import rather than on every rerun
+_HEADER_HTML = """
     <div style='text-align: center; padding: 2rem 0;'>
         <h1 style='color: #2E8B57; margin-bottom: 0.5rem;'>💬 Sundew Solutions</h1>
         <h3 style='color: #666; font-weight: 300;'>Digital First. Digital Fast.</h3>
         <p style='color: #888; font-size: 1.1rem;'>Have a requirement? Let's chat and find the best solutions for your business.</p>
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+# Service categories with direct links
+_SERVICES = {
+    "🤖 AI Chatbots": "Our intelligent automation solutions",
+    "🌐 Web Development": "Custom web applications",
+    "📱 Mobile Solutions": "iOS and Android development",
+    "☁️ Cloud & DevOps": "Scalable infrastructure solutions",
+    "🎨 UX/UI Design": "User-centered design services"
+}
+
+_CONTACT_MD = """
+        ### 📞 Contact Us
+        - **Sales:** sales@sundewsolutions.com
+        - **Support:** support@sundewsolutions.com
+        - **Website:** [sundewsolutions.com](https://sundewsolutions.com)
+        """
+
+_WELCOME_HTML = """
+    <div style='background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+                padding: 2rem; border-radius: 10px; color: white; text-align: center; margin: 2rem 0;'>
+        <h2>🚀 Welcome to Sundew Solutions!</h2>
+        <p style='font-size: 1.2rem; margin: 1rem 0;'>
+            We transform businesses through cutting-edge digital solutions
+        </p>
+    </div>
+    """
+
+_SERVICE_CARD_HTML = """
+        <div style='text-align: center; padding: 1rem; border: 2px solid #e0e0e0; border-radius: 10px;'>
+            <h4>{title}</h4>
+            <p>{text}</p>
+        </div>
+        """
+
+_SERVICE_CARDS = tuple(
+    _SERVICE_CARD_HTML.format(title=title, text=text) for title, text in (
+        ("🤖 AI Automation", "Intelligent chatbots and workflow automation"),
+        ("🌐 Custom Development", "Web and mobile applications tailored to you"),
+        ("☁️ Cloud Solutions", "Scalable infrastructure and DevOps")
+    )
+)
+
+def display_chat_ui(chat_engine, session_manager, config):
+    """Main chat interface with enhanced features"""
+    
+    # Header with company branding
+    st.markdown(_HEADER_HTML, unsafe_allow_html=True)
     
     # Sidebar with company info and navigation
     display_sidebar(config)
@@ -42,16 +85,7 @@ def display_sidebar(config):
     with st.sidebar:
         st.markdown("### 🌟 Quick Links")
         
-        # Service categories with direct links
-        services = {
-            "🤖 AI Chatbots": "Our intelligent automation solutions",
-            "🌐 Web Development": "Custom web applications",
-            "📱 Mobile Solutions": "iOS and Android development",
-            "☁️ Cloud & DevOps": "Scalable infrastructure solutions",
-            "🎨 UX/UI Design": "User-centered design services"
-        }
-        
-        for service, description in services.items():
+        for service, description in _SERVICES.items():
             if st.button(service):
                 st.session_state.selected_service = service
                 st.session_state.chat_stage = 'service_selection'
@@ -60,12 +94,7 @@ def display_sidebar(config):
         st.markdown("---")
         
         # Contact information
-        st.markdown("""
-        ### 📞 Contact Us
-        - **Sales:** sales@sundewsolutions.com
-        - **Support:** support@sundewsolutions.com
-        - **Website:** [sundewsolutions.com](https://sundewsolutions.com)
-        """)
+        st.markdown(_CONTACT_MD)
         
         st.markdown("---")
         
@@ -77,42 +106,12 @@ def display_sidebar(config):
 def display_welcome_stage(session_manager):
     """Initial welcome stage with service promotion"""
     
-    st.markdown("""
-    <div style='background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                padding: 2rem; border-radius: 10px; color: white; text-align: center; margin: 2rem 0;'>
-        <h2>🚀 Welcome to Sundew Solutions!</h2>
-        <p style='font-size: 1.2rem; margin: 1rem 0;'>
-            We transform businesses through cutting-edge digital solutions
-        </p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(_WELCOME_HTML, unsafe_allow_html=True)
     
     # Service showcase
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.markdown("""
-        <div style='text-align: center; padding: 1rem; border: 2px solid #e0e0e0; border-radius: 10px;'>
-            <h4>🤖 AI Automation</h4>
-            <p>Intelligent chatbots and workflow automation</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown("""
-        <div style='text-align: center; padding: 1rem; border: 2px solid #e0e0e0; border-radius: 10px;'>
-            <h4>🌐 Custom Development</h4>
-            <p>Web and mobile applications tailored to you</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown("""
-        <div style='text-align: center; padding: 1rem; border: 2px solid #e0e0e0; border-radius: 10px;'>
-            <h4>☁️ Cloud Solutions</h4>
-            <p>Scalable infrastructure and DevOps</p>
-        </div>
-        """, unsafe_allow_html=True)
+    for col, card_html in zip(st.columns(3), _SERVICE_CARDS):
+        with col:
+            st.markdown(card_html, unsafe_allow_html=True)
     
     st.markdown("### How can we help you today?")
     
@@ -169,7 +168,8 @@ def display_email_collection_stage(session_manager):
     )
     
     if st.button("Continue", type="primary"):
-        if not validate_email(email):
+        email_info = parse_email(email)
+        if not email_info.valid:
             st.error("❗ Please enter a valid email address.")
             return
         
@@ -182,7 +182,7 @@ def display_email_collection_stage(session_manager):
         # Check if business email is required for certain flows
         business_required_types = ["potential_client"]
         
-        if user_type in business_required_types and not is_business_email(email):
+        if user_type in business_required_types and not email_info.is_business:
             st.warning("❗ A business email is preferred for service inquiries. You can continue, but we recommend using your company email for better assistance.")
         
         st.success("✅ Email verified! Let's continue.")
@@ -236,6 +236,25 @@ def display_active_chat_stage(chat_engine, session_manager):
             {"role": "assistant", "content": f"Hello{' ' + name if name else ''}! I'm Chetan, your virtual assistant at Sundew Solutions. How can I help you today?"}
         ]
     
+    _chat_fragment(chat_engine, session_manager)
+
+def _start_new_topic():
+    """Reset the chat history to a fresh prompt"""
+    st.session_state.messages = [
+        {"role": "assistant", "content": "What else would you like to know about Sundew Solutions?"}
+    ]
+
+def _append_canned_exchange(user_msg, response):
+    """Add a scripted user/assistant exchange to the chat history"""
+    st.session_state.messages.append({"role": "user", "content": user_msg})
+    st.session_state.messages.append({"role": "assistant", "content": response})
+
+@st.fragment
+def _chat_fragment(chat_engine, session_manager):
+    """Chat history, input, and quick actions; reruns on its own without the rest of the page"""
+    
+    user_data = session_manager.user_data
+    
     # Display chat history
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -248,11 +267,18 @@ def display_active_chat_stage(chat_engine, session_manager):
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Generate and display assistant response
+        # Stream the assistant response, then swap in the final enhanced version.
+        # Intent and search details go to their own container above the answer,
+        # so replacing the answer slot doesn't remove them
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = chat_engine.process_user_input(prompt, user_data)
-                st.markdown(response)
+            details = st.container()
+            placeholder = st.empty()
+            with details, st.spinner("Thinking..."):
+                streamed = placeholder.container().write_stream(
+                    chat_engine.process_user_input(prompt, user_data)
+                )
+            response = chat_engine.last_response or streamed
+            placeholder.markdown(response)
         
         # Add assistant response to history
         st.session_state.messages.append({"role": "assistant", "content": response})
@@ -267,28 +293,22 @@ def display_active_chat_stage(chat_engine, session_manager):
     st.markdown("---")
     col1, col2, col3, col4 = st.columns(4)
     
+    # Quick actions update history in on_click callbacks, which run before
+    # the fragment reruns, so no extra st.rerun() is needed
     with col1:
-        if st.button("🔄 New Topic"):
-            st.session_state.messages = [
-                {"role": "assistant", "content": "What else would you like to know about Sundew Solutions?"}
-            ]
-            st.rerun()
+        st.button("🔄 New Topic", on_click=_start_new_topic)
     
     with col2:
-        if st.button("📞 Contact Sales"):
-            contact_msg = "I'd like to speak with your sales team about your services. Please provide me with contact details."
-            st.session_state.messages.append({"role": "user", "content": contact_msg})
-            response = "Great! You can reach our sales team at sales@sundewsolutions.com or call us at +91-XXXXXXXXXX. Someone will get back to you within 24 hours. What specific services are you interested in?"
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            st.rerun()
+        st.button("📞 Contact Sales", on_click=_append_canned_exchange, args=(
+            "I'd like to speak with your sales team about your services. Please provide me with contact details.",
+            "Great! You can reach our sales team at sales@sundewsolutions.com or call us at +91-XXXXXXXXXX. Someone will get back to you within 24 hours. What specific services are you interested in?"
+        ))
     
     with col3:
-        if st.button("💼 View Careers"):
-            career_msg = "I'm interested in career opportunities at Sundew Solutions."
-            st.session_state.messages.append({"role": "user", "content": career_msg})
-            response = "Excellent! We're always looking for talented individuals. Check out our careers page at https://sundewsolutions.com/careers for current openings. You can also send your resume to hr@sundewsolutions.com. What type of role are you looking for?"
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            st.rerun()
+        st.button("💼 View Careers", on_click=_append_canned_exchange, args=(
+            "I'm interested in career opportunities at Sundew Solutions.",
+            "Excellent! We're always looking for talented individuals. Check out our careers page at https://sundewsolutions.com/careers for current openings. You can also send your resume to hr@sundewsolutions.com. What type of role are you looking for?"
+        ))
     
     with col4:
         if st.button("💾 Save Chat"):
@@ -3,27 +3,57 @@ Configuration management for the chatbot
 """
 
 import os
-import json
+import orjson
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+
+QUESTIONS_FILE = Path('questions.json')
 
 def load_config():
     """Load configuration from files and environment"""
+    # Built once and shared; rebuilt only when questions.json changes on disk
+    try:
+        questions_mtime = QUESTIONS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        questions_mtime = None
+    return _build_config(questions_mtime)
+
+@lru_cache(maxsize=1)
+def _build_config(questions_mtime):
+    """Build the read-only configuration for the given questions.json version"""
     
     config = {
         # API Configuration
         'openai_api_key': os.getenv('OPENAI_API_KEY'),
         'openai_model': os.getenv('OPENAI_MODEL', 'gpt-4'),
         'openai_temperature': float(os.getenv('OPENAI_TEMPERATURE', '0.2')),
+        'memory_max_tokens': int(os.getenv('MEMORY_MAX_TOKENS', '512')),
         
         # Document Processing
         'data_folder': os.getenv('DATA_FOLDER', 'data'),
+        'index_folder': os.getenv('INDEX_FOLDER', 'data/.index'),
         'min_similarity_threshold': float(os.getenv('MIN_SIMILARITY', '0.21')),
         'max_documents': int(os.getenv('MAX_DOCUMENTS', '3')),
+        'embedding_batch_size': int(os.getenv('EMBEDDING_BATCH_SIZE', '64')),
+        'exact_search_max_docs': int(os.getenv('EXACT_SEARCH_MAX_DOCS', '10000')),
+        'semantic_cache_threshold': float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95')),
+        'semantic_cache_size': int(os.getenv('SEMANTIC_CACHE_SIZE', '512')),
         
         # Intent Detection
         'intent_model': 'valhalla/distilbart-mnli-12-1',
         'embedding_model': 'all-MiniLM-L6-v2',
         'min_confidence': float(os.getenv('MIN_CONFIDENCE', '0.5')),
+        'intent_batch_size': int(os.getenv('INTENT_BATCH_SIZE', '8')),
+        
+        # Model inference backend: 'torch' (eager PyTorch) or 'onnx' (ONNX Runtime)
+        'inference_backend': os.getenv('INFERENCE_BACKEND', 'torch'),
+        # torch.compile the intent model (torch backend only)
+        'compile_intent_model': os.getenv('COMPILE_INTENT_MODEL', 'false').lower() == 'true',
+        # int8 dynamic quantization of the intent model (CPU torch backend only)
+        'quantize_intent_model': os.getenv('QUANTIZE_INTENT_MODEL', 'false').lower() == 'true',
+        # INT8 quantization preset for the ONNX embedder ('' keeps FP32 weights)
+        'embedding_quantization': os.getenv('EMBEDDING_QUANTIZATION', 'avx512_vnni'),
         
         # Categories and mappings
         'categories': [
@@ -125,53 +155,63 @@ def load_config():
     }
     
     # Load questions.json if exists
-    questions_file = Path('questions.json')
-    if questions_file.exists():
-        with open(questions_file, 'r', encoding='utf-8') as f:
-            questions_data = json.load(f)
-            config['questions'] = questions_data
+    if questions_mtime is not None:
+        config['questions'] = orjson.loads(QUESTIONS_FILE.read_bytes())
     
-    return config
+    # Callers share one instance, so keep it from being mutated. Keyword lists
+    # become tuples rather than sets: matching reports the first keyword found
+    config['category_keywords'] = {
+        category: tuple(keywords) for category, keywords in config['category_keywords'].items()
+    }
+    for key, value in config.items():
+        if isinstance(value, dict):
+            config[key] = MappingProxyType(value)
+    return MappingProxyType(config)
+
+# Static catalogue data, built once and shared read-only
+_COMPANY_SERVICES = MappingProxyType({
+    "🤖 AI & Automation": MappingProxyType({
+        "description": "Intelligent chatbots, workflow automation, document processing",
+        "keywords": ("ai", "automation", "chatbot", "workflow", "intelligent"),
+        "benefits": ("24/7 availability", "70% cost reduction", "Improved accuracy")
+    }),
+    "🌐 Custom Development": MappingProxyType({
+        "description": "Web applications, mobile apps, custom software solutions",
+        "keywords": ("web", "mobile", "app", "development", "custom"),
+        "benefits": ("Tailored solutions", "Scalable architecture", "Modern technology")
+    }),
+    "☁️ Cloud & DevOps": MappingProxyType({
+        "description": "Cloud migration, infrastructure, CI/CD, system integration",
+        "keywords": ("cloud", "devops", "aws", "azure", "infrastructure"),
+        "benefits": ("99.9% uptime", "Cost optimization", "Enhanced security")
+    }),
+    "🎨 Digital Experience": MappingProxyType({
+        "description": "UX/UI design, digital transformation, user experience",
+        "keywords": ("design", "ux", "ui", "experience", "digital"),
+        "benefits": ("Better engagement", "Modern design", "User-friendly")
+    }),
+    "🔧 Integration Services": MappingProxyType({
+        "description": "API integration, system connectivity, data migration",
+        "keywords": ("integration", "api", "connect", "migrate", "sync"),
+        "benefits": ("Seamless connectivity", "Data consistency", "Process automation")
+    })
+})
+
+_INDUSTRY_EXPERTISE = (
+    "Healthcare & Life Sciences",
+    "Financial Services & Insurance", 
+    "Retail & E-commerce",
+    "Manufacturing & Logistics",
+    "Media & Entertainment",
+    "Education & Training",
+    "Government & Public Sector",
+    "Real Estate & Construction"
+)
 
 def get_company_services():
     """Get list of company services for display"""
-    return {
-        "🤖 AI & Automation": {
-            "description": "Intelligent chatbots, workflow automation, document processing",
-            "keywords": ["ai", "automation", "chatbot", "workflow", "intelligent"],
-            "benefits": ["24/7 availability", "70% cost reduction", "Improved accuracy"]
-        },
-        "🌐 Custom Development": {
-            "description": "Web applications, mobile apps, custom software solutions",
-            "keywords": ["web", "mobile", "app", "development", "custom"],
-            "benefits": ["Tailored solutions", "Scalable architecture", "Modern technology"]
-        },
-        "☁️ Cloud & DevOps": {
-            "description": "Cloud migration, infrastructure, CI/CD, system integration",
-            "keywords": ["cloud", "devops", "aws", "azure", "infrastructure"],
-            "benefits": ["99.9% uptime", "Cost optimization", "Enhanced security"]
-        },
-        "🎨 Digital Experience": {
-            "description": "UX/UI design, digital transformation, user experience",
-            "keywords": ["design", "ux", "ui", "experience", "digital"],
-            "benefits": ["Better engagement", "Modern design", "User-friendly"]
-        },
-        "🔧 Integration Services": {
-            "description": "API integration, system connectivity, data migration",
-            "keywords": ["integration", "api", "connect", "migrate", "sync"],
-            "benefits": ["Seamless connectivity", "Data consistency", "Process automation"]
-        }
-    }
+    return _COMPANY_SERVICES
 
 def get_industry_expertise():
     """Get list of industries we serve"""
-    return [
-        "Healthcare & Life Sciences",
-        "Financial Services & Insurance", 
-        "Retail & E-commerce",
-        "Manufacturing & Logistics",
-        "Media & Entertainment",
-        "Education & Training",
-        "Government & Public Sector",
-        "Real Estate & Construction"
-    ]
\ No newline at end of file
+    return _INDUSTRY_EXPERTISE
\ No newline at end of file
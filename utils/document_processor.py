@@ -3,20 +3,332 @@ Document processing utilities for content retrieval and ranking
 """
 
 import os
+import logging
+import threading
+import zipfile
+import faiss
+import numpy as np
+import orjson
 import streamlit as st
-from sentence_transformers import SentenceTransformer, util
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 from pathlib import Path
 
+from utils.keyword_matching import present_keywords
+from utils.models import get_embedder
+from utils.semantic_cache import SemanticCache
+
+logger = logging.getLogger('sundew_chatbot')
+
+# Exhaustive inner-product scan for corpora up to exact_search_max_docs. Beyond
+# that, an inverted file over product-quantized codes (one byte per 8 dims)
+# shortlists candidates that are then re-scored against the stored vectors.
+# Stored vectors are half precision; scores are accumulated in float32.
+# Searches selecting no more than exact_search_max_docs rows always scan the
+# half-precision vectors exactly, since IVF probing only sees the selected
+# rows that fall in the probed lists
+EXACT_INDEX_FACTORY = "SQfp16"
+INDEX_FACTORY = "IVF{nlist},PQ{m}x8,Refine(SQfp16)"
+IVF_NPROBE = 8
+RERANK_FACTOR = 4
+
+# Leading characters of a document that are embedded alongside its filename
+EMBED_TEXT_CHARS = 1000
+
+# Threads for reading documents that need embedding; file IO releases the GIL
+READ_WORKERS = 8
+
+def _stat_key(file_path):
+    """(mtime_ns, size) of a file, or None if it cannot be stat'ed"""
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _write_atomically(path, write):
+    """Write a file through a temporary sibling renamed into place, so readers never see a partial file"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+@st.cache_resource(show_spinner="Loading document index...")
+def get_document_processor(_config):
+    """Return the process-wide DocumentProcessor, so the corpus index is loaded once"""
+    return DocumentProcessor(_config)
+
 class DocumentProcessor:
     """Handles document loading, processing, and ranking"""
     
     def __init__(self, config):
         self.config = config
-        self.embedder = SentenceTransformer(config['embedding_model'])
+        backend = config.get('inference_backend', 'torch')
+        quantization = config.get('embedding_quantization') if backend == 'onnx' else None
+        self.embedder = get_embedder(config['embedding_model'], backend, quantization)
+        
+        # Quantized weights give slightly different vectors, so persisted
+        # embeddings are tagged with the quantization as well as the model
+        self._embedding_id = config['embedding_model']
+        if quantization:
+            self._embedding_id += f":qint8_{quantization}"
         self.min_similarity = config['min_similarity_threshold']
         self.max_docs = config['max_documents']
+        self.index_folder = Path(config.get('index_folder', 'data/.index'))
+        
+        # One persistent index over the whole corpus; FAISS ids are row numbers
+        self.index = None
+        self._doc_names = []        # row -> filename
+        self._doc_sources = []      # row -> [folder, file path]
+        self._row_by_path = {}      # file path -> (row, mtime_ns, size) of its current version
+        self._rows_by_folder = {}   # folder path -> rows
+        self._skipped = {}          # file path -> (mtime_ns, size) of an empty or unreadable file
+        
+        # Exact per-file embeddings, so only new or modified files are re-encoded
+        self._emb_cache = self._load_embedding_cache()  # file path -> (mtime_ns, size, vector)
+        
+        # Rankings of recent queries, per (folders, top_k, min_similarity) scope
+        self._query_caches = {}
+        
+        # The processor is shared by all sessions; indexing and search take turns
+        self._index_lock = threading.RLock()
+        self._load_or_build_index()
+    
+    def _list_corpus_files(self):
+        """List (folder, file) pairs across all configured category folders"""
+        files = []
+        for folder_path in dict.fromkeys(self.config['category_folders'].values()):
+            if os.path.exists(folder_path):
+                files.extend((folder_path, p) for p in Path(folder_path).glob("*.txt"))
+        return files
+    
+    def _corpus_manifest(self, files):
+        """Describe the corpus so a persisted index can be checked for staleness"""
+        entries = []
+        for folder_path, file_path in files:
+            # Files that vanish or can't be stat'ed are reported when indexing
+            stat_key = _stat_key(file_path)
+            if stat_key is not None:
+                entries.append([folder_path, str(file_path), *stat_key])
+        index_layout = [EXACT_INDEX_FACTORY, INDEX_FACTORY, self.config.get('exact_search_max_docs', 10000)]
+        return {'model': self._embedding_id, 'index': index_layout, 'files': entries}
+    
+    def _load_or_build_index(self):
+        """Load the persisted corpus index if the corpus is unchanged, else rebuild it"""
+        files = self._list_corpus_files()
+        manifest = self._corpus_manifest(files)
+        index_file = self.index_folder / 'corpus.faiss'
+        manifest_file = self.index_folder / 'manifest.json'
+        
+        if index_file.exists() and manifest_file.exists():
+            try:
+                saved = orjson.loads(manifest_file.read_bytes())
+                if saved.get('corpus') == manifest:
+                    stat_keys = {path: (mtime, size) for _, path, mtime, size in manifest['files']}
+                    rows = [(folder_path, path, stat_keys[path]) for folder_path, path in saved['rows']]
+                    index = faiss.read_index(str(index_file))
+                    if index.ntotal == len(rows):
+                        self.index = index
+                        for folder_path, path, stat_key in rows:
+                            self._register_document(folder_path, Path(path), stat_key)
+                        return
+            except (OSError, ValueError, KeyError, RuntimeError) as e:
+                # A corrupt or half-written index is rebuilt from the documents
+                logger.warning("Discarding persisted index in %s: %s", self.index_folder, e)
+        
+        self._index_documents(files)
+        if self.index is not None:
+            self.index_folder.mkdir(parents=True, exist_ok=True)
+            _write_atomically(index_file, lambda path: faiss.write_index(self.index, str(path)))
+            manifest_bytes = orjson.dumps({'corpus': manifest, 'rows': self._doc_sources})
+            _write_atomically(manifest_file, lambda path: path.write_bytes(manifest_bytes))
+    
+    def _load_embedding_cache(self):
+        """Load cached document embeddings computed with the configured model"""
+        cache_file = self.index_folder / 'embeddings.npz'
+        if not cache_file.exists():
+            return {}
+        
+        try:
+            with np.load(cache_file) as data:
+                if str(data['model']) != self._embedding_id:
+                    return {}
+                return {
+                    path: (int(mtime), int(size), vector)
+                    for path, mtime, size, vector in zip(
+                        data['paths'].tolist(), data['mtimes'], data['sizes'], data['vectors']
+                    )
+                }
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            # A corrupt cache only costs re-encoding the corpus
+            logger.warning("Discarding embedding cache %s: %s", cache_file, e)
+            return {}
+    
+    def _save_embedding_cache(self):
+        """Persist the document embedding cache"""
+        entries = list(self._emb_cache.items())
+        arrays = {
+            'model': np.array(self._embedding_id),
+            'paths': np.array([path for path, _ in entries]),
+            'mtimes': np.array([entry[0] for _, entry in entries], dtype=np.int64),
+            'sizes': np.array([entry[1] for _, entry in entries], dtype=np.int64),
+            'vectors': np.vstack([entry[2] for _, entry in entries])
+        }
+        
+        def write(path):
+            # Saving to an open file keeps np.savez from appending '.npz' to the name
+            with open(path, 'wb') as f:
+                np.savez(f, **arrays)
+        
+        self.index_folder.mkdir(parents=True, exist_ok=True)
+        _write_atomically(self.index_folder / 'embeddings.npz', write)
+    
+    def _register_document(self, folder_path, file_path, stat_key):
+        """Record metadata for the document stored at the next index row, retiring any older version"""
+        self._retire_document(file_path)
+        row = len(self._doc_names)
+        self._doc_names.append(file_path.name)
+        self._doc_sources.append([folder_path, str(file_path)])
+        self._row_by_path[str(file_path)] = (row, *stat_key)
+        self._rows_by_folder.setdefault(folder_path, []).append(row)
+    
+    def _retire_document(self, file_path):
+        """
+        Stop searching a document's current row; the vector stays in the index
+        but is never selected again
+        
+        Returns:
+            True if the document had a row
+        """
+        entry = self._row_by_path.pop(str(file_path), None)
+        if entry is None:
+            return False
+        row = entry[0]
+        self._rows_by_folder[self._doc_sources[row][0]].remove(row)
+        return True
+    
+    def _read_embedding_text(self, file_path):
+        """Read only the leading EMBED_TEXT_CHARS non-blank characters of a document"""
+        text = ''
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                while len(text) < EMBED_TEXT_CHARS:
+                    chunk = f.read(EMBED_TEXT_CHARS - len(text))
+                    if not chunk:
+                        break
+                    text = (text + chunk).lstrip()
+        except Exception as e:
+            # Returned rather than raised; worker threads cannot report to the page
+            return e
+        return text
+    
+    def _index_documents(self, files):
+        """
+        Read and embed (folder, file) documents, adding them to the corpus index
+        
+        Args:
+            files: List of (folder path, file Path) pairs
+            
+        Returns:
+            Number of documents whose rows were added or retired
+        """
+        vectors = []
+        retired = 0
+        texts = []
+        misses = []  # (position in vectors, cache key) for documents needing encode
+        pending = []  # (folder, file, stat) for documents without a valid cached embedding
+        
+        for folder_path, file_path in files:
+            try:
+                stat = file_path.stat()
+            except Exception as e:
+                st.warning(f"Error processing {file_path}: {str(e)}")
+                continue
+            
+            cached = self._emb_cache.get(str(file_path))
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                # Unchanged since it was embedded; no need to read it at all
+                self._register_document(folder_path, file_path, cached[:2])
+                vectors.append(cached[2])
+            else:
+                pending.append((folder_path, file_path, stat))
+        
+        # Threads are only started for submitted reads, so this is free when all are cached
+        with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+            pending_texts = list(pool.map(
+                self._read_embedding_text, [file_path for _, file_path, _ in pending]
+            ))
+        
+        for (folder_path, file_path, stat), text in zip(pending, pending_texts):
+            if isinstance(text, Exception) or not text.strip():
+                # Remembered so the file is only retried once it changes
+                self._skipped[str(file_path)] = (stat.st_mtime_ns, stat.st_size)
+                retired += self._retire_document(file_path)
+                if isinstance(text, Exception):
+                    st.warning(f"Error processing {file_path}: {str(text)}")
+                continue
+            
+            self._skipped.pop(str(file_path), None)
+            self._register_document(folder_path, file_path, (stat.st_mtime_ns, stat.st_size))
+            misses.append((len(vectors), (str(file_path), stat.st_mtime_ns, stat.st_size)))
+            vectors.append(None)
+            # Create combined text for better matching
+            texts.append(f"{file_path.name} {text}")
+        
+        if texts:
+            # One batched call for all uncached documents; encode() already orders
+            # inputs by length so each batch is padded only to its longest text
+            embeddings = self.embedder.encode(
+                texts,
+                batch_size=self.config.get('embedding_batch_size', 64),
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            ).astype(np.float32)
+            
+            for (position, (path, mtime, size)), embedding in zip(misses, embeddings):
+                vectors[position] = embedding
+                self._emb_cache[path] = (mtime, size, embedding)
+            self._save_embedding_cache()
+        
+        if vectors:
+            embeddings = np.vstack(vectors)
+            if self.index is None:
+                if len(embeddings) <= self.config.get('exact_search_max_docs', 10000):
+                    factory = EXACT_INDEX_FACTORY
+                else:
+                    factory = INDEX_FACTORY.format(
+                        nlist=int(np.sqrt(len(embeddings))), m=embeddings.shape[1] // 8
+                    )
+                self.index = faiss.index_factory(
+                    embeddings.shape[1], factory, faiss.METRIC_INNER_PRODUCT
+                )
+                self.index.train(embeddings)
+            self.index.add(embeddings)
+        return len(vectors) + retired
+    
+    def _search(self, query_embedding, rows, k):
+        """Top-k (similarity, row) pairs among the given rows"""
+        selector = faiss.IDSelectorBatch(np.asarray(rows, dtype=np.int64))
+        index = self.index
+        if not isinstance(index, faiss.IndexRefine):
+            params = faiss.SearchParameters(sel=selector)
+        elif len(rows) <= self.config.get('exact_search_max_docs', 10000):
+            # Score every selected row against the refine stage's SQfp16 codes
+            index = faiss.downcast_index(index.refine_index)
+            params = faiss.SearchParameters(sel=selector)
+        else:
+            params = faiss.IndexRefineSearchParameters(
+                k_factor=RERANK_FACTOR,
+                base_index_params=faiss.SearchParametersIVF(sel=selector, nprobe=IVF_NPROBE)
+            )
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        similarities, ids = index.search(query, k, params=params)
+        return [(float(sim), int(row)) for sim, row in zip(similarities[0], ids[0]) if row >= 0]
     
-    def rank_documents(self, user_prompt, folders, top_k=None, min_similarity=None):
+    def rank_documents(self, user_prompt, folders, top_k=None, min_similarity=None, query_embedding=None):
         """
         Rank documents based on similarity to user prompt
         
@@ -25,73 +337,120 @@ class DocumentProcessor:
             folders: List of folder paths to search
             top_k: Maximum number of documents to return
             min_similarity: Minimum similarity threshold
+            query_embedding: Precomputed embedding of user_prompt, if available
             
         Returns:
-            List of tuples (similarity, filename, content)
+            List of tuples (similarity, filename, content, row), most similar first
         """
         if top_k is None:
             top_k = self.max_docs
         if min_similarity is None:
             min_similarity = self.min_similarity
             
-        query_embedding = self.embedder.encode(user_prompt, convert_to_tensor=True)
-        results = []
+        if query_embedding is None:
+            query_embedding = self.embedder.encode(user_prompt, normalize_embeddings=True)
         
-        for folder in folders:
-            folder_results = self._process_folder(folder, query_embedding, min_similarity)
-            results.extend(folder_results)
-        
-        # Sort by similarity and return top results
-        results.sort(reverse=True, key=lambda x: x[0])
-        return results[:top_k]
+        # Progress is collected and rendered once: a summary line, one warning
+        # for missing folders, and per-folder/per-file details in an expander
+        log_lines = []
+        missing_folders = []
+        summary = None
+        try:
+            # Restrict the corpus-wide search to the requested folders
+            rows = []
+            with self._index_lock:
+                for folder in folders:
+                    rows.extend(self._folder_rows(folder, log_lines, missing_folders))
+            
+            if not rows:
+                return []
+            
+            # A near-duplicate of a recent question gets its ranking back unchanged
+            scope = (tuple(folders), top_k, min_similarity)
+            cache = self._query_caches.get(scope)
+            if cache is None:
+                cache = self._query_caches[scope] = SemanticCache(
+                    len(query_embedding),
+                    threshold=self.config.get('semantic_cache_threshold', 0.95),
+                    max_entries=self.config.get('semantic_cache_size', 512)
+                )
+            cached = cache.get(query_embedding)
+            logger.debug("Semantic cache hit rate: %.2f%% (%d/%d)",
+                         100 * cache.hit_rate(), cache.hits, cache.hits + cache.misses)
+            if cached is not None:
+                summary = f"♻️ Reusing {len(cached)} documents ranked for a similar question"
+                return list(cached)
+            
+            with self._index_lock:
+                hits = self._search(query_embedding, rows, top_k)
+            
+            results = []
+            for similarity, row in hits:
+                filename = self._doc_names[row]
+                
+                if similarity >= min_similarity:
+                    # Full text is only read for documents that are returned
+                    content = self._read_content(row)
+                    if content is None:
+                        continue
+                    results.append((similarity, filename, content, row))
+                    log_lines.append(f"✅ {filename}: {similarity:.3f}")
+                else:
+                    log_lines.append(f"⚪ {filename}: {similarity:.3f} (below threshold)")
+            
+            summary = f"📊 Found {len(results)} relevant documents among {len(rows)} files"
+            cache.put(query_embedding, tuple(results))
+            return results
+        finally:
+            self._render_search_log(summary, log_lines, missing_folders)
     
-    def _process_folder(self, folder_path, query_embedding, min_similarity):
-        """Process all documents in a folder"""
-        results = []
-        
+    def _render_search_log(self, summary, log_lines, missing_folders):
+        """Render the progress collected while ranking in as few elements as possible"""
+        if missing_folders:
+            st.warning(f"⚠️ Folders not found: {', '.join(missing_folders)}")
+        if summary:
+            st.write(summary)
+        if log_lines:
+            with st.expander(f"Search details ({len(log_lines)} entries)"):
+                st.code("\n".join(log_lines))
+    
+    def _read_content(self, row):
+        """Read the full text of an indexed document"""
+        file_path = self._doc_sources[row][1]
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except Exception as e:
+            st.warning(f"Error processing {file_path}: {str(e)}")
+            return None
+    
+    def _folder_rows(self, folder_path, log_lines, missing_folders):
+        """Index rows for a folder, (re)indexing files added or modified since they were last seen"""
         if not os.path.exists(folder_path):
-            st.warning(f"⚠️ Folder not found: {folder_path}")
-            return results
+            missing_folders.append(folder_path)
+            return []
         
-        st.write(f"🔍 Searching in: {folder_path}")
+        log_lines.append(f"🔍 Searching in: {folder_path}")
         
         # Get all text files in folder
-        folder = Path(folder_path)
-        text_files = list(folder.glob("*.txt"))
+        text_files = list(Path(folder_path).glob("*.txt"))
         
         if not text_files:
-            st.write(f"📄 No text files found in {folder_path}")
-            return results
+            log_lines.append(f"📄 No text files found in {folder_path}")
+            return []
         
-        processed_count = 0
-        for file_path in text_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                
-                if not content:
-                    continue
-                
-                # Create combined text for better matching
-                filename = file_path.name
-                combined_text = f"{filename} {content[:1000]}"  # Use first 1000 chars
-                
-                # Calculate similarity
-                doc_embedding = self.embedder.encode(combined_text, convert_to_tensor=True)
-                similarity = util.pytorch_cos_sim(query_embedding, doc_embedding).item()
-                
-                if similarity >= min_similarity:
-                    results.append((similarity, filename, content))
-                    st.write(f"✅ {filename}: {similarity:.3f}")
-                    processed_count += 1
-                else:
-                    st.write(f"⚪ {filename}: {similarity:.3f} (below threshold)")
-                    
-            except Exception as e:
-                st.warning(f"Error processing {file_path}: {str(e)}")
+        changed_files = []
+        for p in text_files:
+            known = self._row_by_path.get(str(p))
+            known = known[1:] if known is not None else self._skipped.get(str(p))
+            if known is None or known != _stat_key(p):
+                changed_files.append(p)
         
-        st.write(f"📊 Processed {processed_count} relevant documents from {len(text_files)} files")
-        return results
+        if changed_files and self._index_documents([(folder_path, p) for p in changed_files]):
+            # Cached rankings predate these documents
+            self._query_caches.clear()
+        
+        return [self._row_by_path[str(p)][0] for p in text_files if str(p) in self._row_by_path]
     
     def load_document_content(self, file_path):
         """Load content from a specific document"""
@@ -121,6 +480,11 @@ class DocumentProcessor:
     def search_documents_by_keywords(self, keywords, folders):
         """Search documents using keyword matching"""
         results = []
+        if not keywords:
+            return results
+        
+        lowered = [keyword.lower() for keyword in keywords]
+        unique_keywords = tuple(sorted(set(lowered)))
         
         for folder_path in folders:
             if not os.path.exists(folder_path):
@@ -132,8 +496,9 @@ class DocumentProcessor:
                     with open(file_path, 'r', encoding='utf-8') as f:
                         content = f.read().lower()
                     
-                    # Count keyword matches
-                    matches = sum(1 for keyword in keywords if keyword.lower() in content)
+                    # Count keyword matches with a single scan of the content
+                    present = present_keywords(unique_keywords, content)
+                    matches = sum(1 for keyword in lowered if keyword in present)
                     
                     if matches > 0:
                         # Calculate simple relevance score
@@ -144,7 +509,7 @@ class DocumentProcessor:
                     st.warning(f"Error searching {file_path}: {str(e)}")
         
         # Sort by relevance
-        results.sort(reverse=True, key=lambda x: x[0])
+        results.sort(reverse=True, key=itemgetter(0))
         return results
     
     def get_folder_statistics(self, folder_path):
@@ -2,22 +2,95 @@
 Intent detection utilities for understanding user queries
 """
 
+import logging
+from collections import Counter, OrderedDict
+from itertools import chain
+
+import numpy as np
 import streamlit as st
-from transformers import pipeline
+import torch
+
+from utils.keyword_matching import category_bucket, lowered_user_message, present_keywords
+from utils.models import get_classifier
+
+logger = logging.getLogger('sundew_chatbot')
+
+# Hypothesis template used by the zero-shot pipeline
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+# Classification results kept per detector, most recently used last
+CLASSIFICATION_CACHE_SIZE = 1024
+
+# Conversation clues for classify_user_type; a turn counts once per bucket
+USER_TYPE_TERMS = {
+    'service': ('service', 'solution', 'help', 'business', 'project'),
+    'career': ('job', 'career', 'position', 'hiring', 'work'),
+    'info': ('about', 'company', 'information', 'know')
+}
+_USER_TYPE_KEYWORDS = tuple(sorted({term for terms in USER_TYPE_TERMS.values() for term in terms}))
 
 class IntentDetector:
     """Detects user intents and maps to appropriate content categories"""
     
+    # Follow-up questions by category bucket; case studies have none
+    _FOLLOWUPS = {
+        'service': (
+            "Would you like to see our case studies?",
+            "What's your timeline for implementation?",
+            "Can I connect you with our solutions expert?"
+        ),
+        'career': (
+            "What type of role are you interested in?",
+            "Would you like to know about our company culture?",
+            "Can I help you find current job openings?"
+        ),
+        'company': (
+            "Would you like to know about our leadership team?",
+            "Are you interested in our company values?",
+            "Can I tell you about our recent achievements?"
+        )
+    }
+    
     def __init__(self, config):
         self.config = config
-        self.classifier = pipeline(
-            "zero-shot-classification", 
-            model=config['intent_model']
+        self.classifier = get_classifier(
+            config['intent_model'], config.get('inference_backend', 'torch'),
+            config.get('compile_intent_model', False), config.get('quantize_intent_model', False)
         )
         self.categories = config['categories']
         self.category_folders = config['category_folders']
         self.category_keywords = config['category_keywords']
+        self._category_bucket = {category: category_bucket(category) for category in self.categories}
+        
+        # Keywords lowered once; a prompt is scanned for all of them in one pass
+        self._lowered_keywords = [
+            (category, [(keyword.lower(), keyword) for keyword in keywords])
+            for category, keywords in self.category_keywords.items()
+        ]
+        self._all_keywords = tuple(sorted({
+            lowered for _, keywords in self._lowered_keywords for lowered, _ in keywords
+        }))
         self.min_confidence = config['min_confidence']
+        self.batch_size = config.get('intent_batch_size', 8)
+        
+        # The candidate labels never change, so their hypotheses are tokenized
+        # once; each call only tokenizes the user prompt
+        self._tokenizer = self.classifier.tokenizer
+        self._hypothesis_ids = [
+            self._tokenizer(HYPOTHESIS_TEMPLATE.format(category), add_special_tokens=False)['input_ids']
+            for category in self.categories
+        ]
+        self._max_premise_length = (
+            self._tokenizer.model_max_length
+            - max(len(ids) for ids in self._hypothesis_ids)
+            - self._tokenizer.num_special_tokens_to_add(pair=True)
+        )
+        
+        # The classifier is deterministic, so repeated prompts reuse their scores
+        self._classification_cache = OrderedDict()  # prompt -> {'labels', 'scores'}
+        
+        # History is append-only, so each turn's intents are detected once
+        self._turn_intents = {}  # (turn number, user message) -> intent result
     
     def detect_intents(self, user_prompt, min_confidence=None, score_margin=0.05):
         """
@@ -29,7 +102,8 @@ class IntentDetector:
             score_margin: Margin for including multiple intents
             
         Returns:
-            Dictionary with detected intents and relevant folders
+            Dictionary with detected intents and relevant folders; nothing is
+            rendered, see render_intent_debug
         """
         if min_confidence is None:
             min_confidence = self.min_confidence
@@ -38,29 +112,68 @@ class IntentDetector:
         keyword_matches = self._detect_by_keywords(user_prompt)
         
         if keyword_matches:
-            st.write("✅ Intent detected using keyword matching:")
-            for match in keyword_matches:
-                st.write(f"  - {match['category']} (keyword: '{match['keyword']}')")
-            
-            return {
-                'method': 'keyword',
-                'categories': [match['category'] for match in keyword_matches],
-                'folders': [self.category_folders[match['category']] for match in keyword_matches],
-                'confidence': 1.0,
-                'details': keyword_matches
-            }
+            return self._keyword_intent(keyword_matches)
         
         # Fallback to ML-based classification
         return self._detect_by_ml(user_prompt, min_confidence, score_margin)
     
+    def detect_intents_batch(self, user_prompts, min_confidence=None, score_margin=0.05):
+        """
+        Detect intents for several prompts, classifying all keyword misses in one batch
+        
+        Args:
+            user_prompts: List of user input texts
+            min_confidence: Minimum confidence threshold
+            score_margin: Margin for including multiple intents
+            
+        Returns:
+            List of intent dictionaries aligned with user_prompts
+        """
+        if min_confidence is None:
+            min_confidence = self.min_confidence
+        
+        intents = [None] * len(user_prompts)
+        ml_positions = []
+        for position, user_prompt in enumerate(user_prompts):
+            keyword_matches = self._detect_by_keywords(user_prompt)
+            if keyword_matches:
+                intents[position] = self._keyword_intent(keyword_matches)
+            else:
+                ml_positions.append(position)
+        
+        if ml_positions:
+            try:
+                results = self._classify([user_prompts[position] for position in ml_positions])
+                for position, result in zip(ml_positions, results):
+                    intents[position] = self._ml_intent(result, min_confidence, score_margin)
+            except Exception as e:
+                logger.warning("ML classification error: %s", e)
+                for position in ml_positions:
+                    intents[position] = self._get_fallback_intent(e)
+        
+        return intents
+    
+    def _keyword_intent(self, keyword_matches):
+        """Build the intent result for keyword matches"""
+        return {
+            'method': 'keyword',
+            'categories': [match['category'] for match in keyword_matches],
+            'buckets': [self._category_bucket[match['category']] for match in keyword_matches],
+            'folders': [self.category_folders[match['category']] for match in keyword_matches],
+            'confidence': 1.0,
+            'details': keyword_matches
+        }
+    
     def _detect_by_keywords(self, user_prompt):
         """Detect intents using keyword matching"""
-        prompt_lower = user_prompt.lower()
+        present = present_keywords(self._all_keywords, user_prompt.lower())
         matches = []
+        if not present:
+            return matches
         
-        for category, keywords in self.category_keywords.items():
-            for keyword in keywords:
-                if keyword.lower() in prompt_lower:
+        for category, keywords in self._lowered_keywords:
+            for lowered, keyword in keywords:
+                if lowered in present:
                     matches.append({
                         'category': category,
                         'keyword': keyword,
@@ -73,53 +186,137 @@ class IntentDetector:
     def _detect_by_ml(self, user_prompt, min_confidence, score_margin):
         """Detect intents using machine learning classification"""
         try:
-            result = self.classifier(user_prompt, self.categories)
-            
-            top_score = result['scores'][0]
-            selected = []
+            result = self._classify([user_prompt])[0]
+            return self._ml_intent(result, min_confidence, score_margin)
             
-            for label, score in zip(result['labels'], result['scores']):
-                if score >= min_confidence and (top_score - score) <= score_margin:
-                    selected.append({
-                        'category': label,
-                        'confidence': score,
-                        'method': 'ml'
-                    })
+        except Exception as e:
+            logger.warning("ML classification error: %s", e)
+            return self._get_fallback_intent(e)
+    
+    def _classify(self, user_prompts):
+        """
+        Zero-shot classify prompts against the categories, reusing the scores of
+        previously classified prompts
+        
+        Args:
+            user_prompts: List of user input texts
             
-            # Fallback to general information if nothing detected
-            if not selected:
+        Returns:
+            List of {'labels', 'scores'} dicts sorted by descending score; these
+            are shared with the cache and must not be modified
+        """
+        cache = self._classification_cache
+        misses = list(dict.fromkeys(prompt for prompt in user_prompts if prompt not in cache))
+        if misses:
+            for prompt, result in zip(misses, self._run_classifier(misses)):
+                cache[prompt] = result
+        
+        results = []
+        for prompt in user_prompts:
+            cache.move_to_end(prompt)
+            results.append(cache[prompt])
+        
+        while len(cache) > CLASSIFICATION_CACHE_SIZE:
+            cache.popitem(last=False)
+        return results
+    
+    def _run_classifier(self, user_prompts):
+        """Score prompts like the zero-shot pipeline, reusing the pre-tokenized hypotheses"""
+        premise_ids = self._tokenizer(
+            user_prompts, add_special_tokens=False,
+            truncation=True, max_length=self._max_premise_length
+        )['input_ids']
+        
+        features = []
+        for premise in premise_ids:
+            for hypothesis in self._hypothesis_ids:
+                feature = {'input_ids': self._tokenizer.build_inputs_with_special_tokens(premise, hypothesis)}
+                if 'token_type_ids' in self._tokenizer.model_input_names:
+                    feature['token_type_ids'] = self._tokenizer.create_token_type_ids_from_sequences(
+                        premise, hypothesis
+                    )
+                features.append(feature)
+        
+        # All premise/hypothesis pairs, batch_size prompts per forward pass
+        rows_per_pass = self.batch_size * len(self.categories)
+        entailment_logits = []
+        with torch.inference_mode():
+            for start in range(0, len(features), rows_per_pass):
+                batch = self._tokenizer.pad(features[start:start + rows_per_pass], return_tensors='pt')
+                batch = {name: tensor.to(self.classifier.device) for name, tensor in batch.items()}
+                logits = self.classifier.model(**batch).logits
+                entailment_logits.append(logits[:, self.classifier.entailment_id].float().cpu().numpy())
+        
+        # Softmax over the categories of each prompt, as the pipeline does for single-label
+        entailment_logits = np.concatenate(entailment_logits).reshape(len(user_prompts), len(self.categories))
+        scores = np.exp(entailment_logits - entailment_logits.max(axis=1, keepdims=True))
+        scores /= scores.sum(axis=1, keepdims=True)
+        
+        results = []
+        for prompt_scores in scores:
+            order = np.argsort(-prompt_scores)
+            results.append({
+                'labels': [self.categories[i] for i in order],
+                'scores': prompt_scores[order].tolist()
+            })
+        return results
+    
+    def _ml_intent(self, result, min_confidence, score_margin):
+        """Build the intent result for one zero-shot classification output"""
+        top_score = result['scores'][0]
+        selected = []
+        
+        for label, score in zip(result['labels'], result['scores']):
+            if score >= min_confidence and (top_score - score) <= score_margin:
                 selected.append({
-                    'category': "general information about the company",
-                    'confidence': 1.0,
-                    'method': 'fallback'
+                    'category': label,
+                    'confidence': score,
+                    'method': 'ml'
                 })
-            
-            st.write("🤖 Intent detected using ML classification:")
-            for item in selected:
-                st.write(f"  - {item['category']} ({item['confidence']:.3f})")
-            
-            return {
-                'method': 'ml',
-                'categories': [item['category'] for item in selected],
-                'folders': [self.category_folders[item['category']] for item in selected],
-                'confidence': top_score,
-                'details': selected
-            }
-            
-        except Exception as e:
-            st.warning(f"ML classification error: {str(e)}")
-            return self._get_fallback_intent()
+        
+        # Fallback to general information if nothing detected
+        if not selected:
+            selected.append({
+                'category': "general information about the company",
+                'confidence': 1.0,
+                'method': 'fallback'
+            })
+        
+        return {
+            'method': 'ml',
+            'categories': [item['category'] for item in selected],
+            'buckets': [self._category_bucket[item['category']] for item in selected],
+            'folders': [self.category_folders[item['category']] for item in selected],
+            'confidence': top_score,
+            'details': selected
+        }
     
-    def _get_fallback_intent(self):
+    def _get_fallback_intent(self, error):
         """Return fallback intent when detection fails"""
         return {
             'method': 'fallback',
             'categories': ["general information about the company"],
+            'buckets': [self._category_bucket["general information about the company"]],
             'folders': [self.category_folders["general information about the company"]],
             'confidence': 1.0,
-            'details': [{'category': "general information about the company", 'method': 'fallback'}]
+            'details': [{'category': "general information about the company", 'method': 'fallback'}],
+            'error': str(error)
         }
     
+    def render_intent_debug(self, intent_result):
+        """Show how the intents of a live query were detected"""
+        method = intent_result['method']
+        if method == 'keyword':
+            st.write("✅ Intent detected using keyword matching:")
+            for match in intent_result['details']:
+                st.write(f"  - {match['category']} (keyword: '{match['keyword']}')")
+        elif method == 'ml':
+            st.write("🤖 Intent detected using ML classification:")
+            for item in intent_result['details']:
+                st.write(f"  - {item['category']} ({item['confidence']:.3f})")
+        elif 'error' in intent_result:
+            st.warning(f"ML classification error: {intent_result['error']}")
+    
     def analyze_user_journey(self, conversation_history):
         """Analyze user's journey through the conversation"""
         if not conversation_history:
@@ -128,18 +325,28 @@ class IntentDetector:
         intents_over_time = []
         topics_discussed = set()
         
-        for turn in conversation_history:
-            user_message = turn.get('user', '')
-            if user_message:
-                intent_result = self.detect_intents(user_message)
-                intents_over_time.append({
-                    'turn': turn.get('turn', 0),
-                    'intents': intent_result['categories'],
-                    'confidence': intent_result['confidence']
-                })
-                
-                # Track topics
-                topics_discussed.update(intent_result['categories'])
+        # Detect intents for turns not seen before, in one batch
+        user_turns = [turn for turn in conversation_history if turn.get('user', '')]
+        turn_keys = [(turn.get('turn', 0), turn['user']) for turn in user_turns]
+        new_keys = list(dict.fromkeys(key for key in turn_keys if key not in self._turn_intents))
+        new_results = {}
+        if new_keys:
+            new_results = dict(zip(new_keys, self.detect_intents_batch([message for _, message in new_keys])))
+            # Fallbacks from a failed classifier call are retried next time
+            self._turn_intents.update(
+                (key, result) for key, result in new_results.items() if 'error' not in result
+            )
+        
+        for turn, key in zip(user_turns, turn_keys):
+            intent_result = new_results.get(key) or self._turn_intents[key]
+            intents_over_time.append({
+                'turn': turn.get('turn', 0),
+                'intents': intent_result['categories'],
+                'confidence': intent_result['confidence']
+            })
+            
+            # Track topics
+            topics_discussed.update(intent_result['categories'])
         
         # Analyze patterns
         journey_analysis = {
@@ -159,16 +366,10 @@ class IntentDetector:
             return None
         
         # Count intent occurrences
-        intent_counts = {}
-        for item in intents_over_time:
-            for intent in item['intents']:
-                intent_counts[intent] = intent_counts.get(intent, 0) + 1
-        
-        if not intent_counts:
-            return None
+        intent_counts = Counter(chain.from_iterable(item['intents'] for item in intents_over_time))
         
         # Return most common intent
-        return max(intent_counts.items(), key=lambda x: x[1])
+        return intent_counts.most_common(1)[0] if intent_counts else None
     
     def _calculate_engagement_level(self, intents_over_time):
         """Calculate user engagement level based on intent patterns"""
@@ -176,7 +377,12 @@ class IntentDetector:
             return 'none'
         
         total_turns = len(intents_over_time)
-        unique_intents = len(set(intent for item in intents_over_time for intent in item['intents']))
+        
+        # Every term of the score is non-negative, so enough turns alone decide it
+        if total_turns * 0.4 > 3.0:
+            return 'high'
+        
+        unique_intents = len(set(chain.from_iterable(item['intents'] for item in intents_over_time)))
         avg_confidence = sum(item['confidence'] for item in intents_over_time) / total_turns
         
         # Simple engagement scoring
@@ -193,29 +399,14 @@ class IntentDetector:
         """Suggest follow-up questions based on detected intents"""
         suggestions = []
         
-        for category in detected_intents.get('categories', []):
-            if 'service' in category.lower():
-                suggestions.extend([
-                    "Would you like to see our case studies?",
-                    "What's your timeline for implementation?",
-                    "Can I connect you with our solutions expert?"
-                ])
-            elif 'career' in category.lower():
-                suggestions.extend([
-                    "What type of role are you interested in?",
-                    "Would you like to know about our company culture?",
-                    "Can I help you find current job openings?"
-                ])
-            elif 'company' in category.lower() or 'about' in category.lower():
-                suggestions.extend([
-                    "Would you like to know about our leadership team?",
-                    "Are you interested in our company values?",
-                    "Can I tell you about our recent achievements?"
-                ])
-        
-        # Remove duplicates and limit suggestions
-        unique_suggestions = list(dict.fromkeys(suggestions))[:3]
-        return unique_suggestions
+        for bucket in detected_intents.get('buckets', ()):
+            for suggestion in self._FOLLOWUPS.get(bucket, ()):
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+                    if len(suggestions) == 3:
+                        return suggestions
+        
+        return suggestions
     
     def classify_user_type(self, user_data, conversation_history):
         """Classify user type based on available data"""
@@ -225,19 +416,18 @@ class IntentDetector:
         if explicit_type:
             return explicit_type
         
-        # Analyze conversation for clues
-        service_mentions = 0
-        career_mentions = 0
-        info_mentions = 0
-        
+        # Analyze conversation for clues, scanning each message once
+        mentions = Counter()
         for turn in conversation_history:
-            user_msg = turn.get('user', '').lower()
-            if any(word in user_msg for word in ['service', 'solution', 'help', 'business', 'project']):
-                service_mentions += 1
-            if any(word in user_msg for word in ['job', 'career', 'position', 'hiring', 'work']):
-                career_mentions += 1
-            if any(word in user_msg for word in ['about', 'company', 'information', 'know']):
-                info_mentions += 1
+            present = present_keywords(_USER_TYPE_KEYWORDS, lowered_user_message(turn))
+            if present:
+                mentions.update(
+                    bucket for bucket, terms in USER_TYPE_TERMS.items() if not present.isdisjoint(terms)
+                )
+        
+        service_mentions = mentions['service']
+        career_mentions = mentions['career']
+        info_mentions = mentions['info']
         
         # Determine type based on patterns
         if service_mentions > career_mentions and service_mentions > info_mentions:
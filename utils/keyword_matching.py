@@ -0,0 +1,53 @@
+"""
+Single-pass keyword matching shared by intent detection and document search,
+and the category buckets shared by intent detection and response enhancement
+"""
+
+import re
+from functools import lru_cache
+
+@lru_cache(maxsize=64)
+def keyword_pattern(keywords):
+    """One-pass matcher for a keyword tuple, reporting the longest keyword found at each position"""
+    # Longest first, so a keyword that is a prefix of another is implied by the
+    # longer match at the same position (see present_keywords)
+    alternatives = sorted(keywords, key=len, reverse=True)
+    return re.compile('(?=(' + '|'.join(map(re.escape, alternatives)) + '))')
+
+def present_keywords(keywords, text):
+    """
+    Find which keywords occur in text, with a single scan of the text
+    
+    Args:
+        keywords: Tuple of lowercase keywords
+        text: Lowercase text to search
+        
+    Returns:
+        Set of the keywords that are substrings of text
+    """
+    found = {m.group(1) for m in keyword_pattern(keywords).finditer(text)}
+    return {keyword for keyword in keywords if any(keyword in match for match in found)}
+
+def lowered_user_message(turn):
+    """Lowercased user message of a conversation turn, cached on the turn dict"""
+    lowered = turn.get('_user_lower')
+    if lowered is None:
+        lowered = turn['_user_lower'] = turn.get('user', '').lower()
+    return lowered
+
+# Coarse buckets the response enhancer branches on; a category takes the
+# first bucket whose terms appear in its name
+CATEGORY_BUCKET_TERMS = (
+    ('service', ('service',)),
+    ('career', ('career',)),
+    ('case', ('case', 'success')),
+    ('company', ('company', 'about'))
+)
+
+def category_bucket(category):
+    """Return the enhancer bucket for a category name, or None"""
+    lowered = category.lower()
+    for bucket, terms in CATEGORY_BUCKET_TERMS:
+        if any(term in lowered for term in terms):
+            return bucket
+    return None
\ No newline at end of file
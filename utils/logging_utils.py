@@ -3,12 +3,25 @@ Logging utilities for the chatbot application
 """
 
 import logging
+import logging.handlers
 import os
 from pathlib import Path
 from datetime import datetime
 
+# Rotate the log file instead of letting it grow without bound
+LOG_MAX_BYTES = 10_000_000
+LOG_BACKUP_COUNT = 5
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Logger returned by the first setup_logging call; Streamlit calls it on every rerun
+_logger = None
+
 def setup_logging(log_level='INFO', log_file=None):
     """Setup logging configuration"""
+    global _logger
+    if _logger is not None:
+        return _logger
     
     # Create logs directory
     Path('logs').mkdir(exist_ok=True)
@@ -16,28 +29,34 @@ def setup_logging(log_level='INFO', log_file=None):
     if not log_file:
         log_file = f"logs/chatbot_{datetime.now().strftime('%Y%m%d')}.log"
     
-    # Configure logging
-    logging.basicConfig(
-        level=getattr(logging, log_level.upper()),
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler()  # Also log to console
-        ]
-    )
+    # Configure logging with one formatter shared by both handlers
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        ),
+        logging.StreamHandler()  # Also log to console
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    logging.basicConfig(level=getattr(logging, log_level.upper()), handlers=handlers)
     
     # Create logger
     logger = logging.getLogger('sundew_chatbot')
     
     # Log startup
     logger.info("Logging system initialized")
-    logger.info(f"Log file: {log_file}")
-    logger.info(f"Log level: {log_level}")
+    logger.info("Log file: %s", log_file)
+    logger.info("Log level: %s", log_level)
     
+    _logger = logger
     return logger
 
 def log_user_interaction(logger, session_id, event, data=None):
     """Log user interaction events"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     log_data = {
         'session_id': session_id,
         'event': event,
@@ -47,10 +66,13 @@ def log_user_interaction(logger, session_id, event, data=None):
     if data:
         log_data.update(data)
     
-    logger.info(f"User Interaction: {log_data}")
+    logger.info("User Interaction: %s", log_data)
 
 def log_error(logger, error, context=None):
     """Log errors with context"""
+    if not logger.isEnabledFor(logging.ERROR):
+        return
+    
     error_data = {
         'error': str(error),
         'type': type(error).__name__,
@@ -60,10 +82,13 @@ def log_error(logger, error, context=None):
     if context:
         error_data['context'] = context
     
-    logger.error(f"Error occurred: {error_data}")
+    logger.error("Error occurred: %s", error_data)
 
 def log_performance(logger, operation, duration, success=True):
     """Log performance metrics"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     performance_data = {
         'operation': operation,
         'duration_seconds': duration,
@@ -71,7 +96,7 @@ def log_performance(logger, operation, duration, success=True):
         'timestamp': datetime.now().isoformat()
     }
     
-    logger.info(f"Performance: {performance_data}")
+    logger.info("Performance: %s", performance_data)
 
 class ChatLogger:
     """Specialized logger for chat operations"""
@@ -81,34 +106,39 @@ class ChatLogger:
     
     def log_message_processed(self, session_id, user_message, bot_response, processing_time):
         """Log message processing"""
-        self.logger.info(f"Message processed - Session: {session_id}, "
-                        f"User msg length: {len(user_message)}, "
-                        f"Bot response length: {len(bot_response)}, "
-                        f"Processing time: {processing_time:.2f}s")
+        self.logger.info("Message processed - Session: %s, "
+                         "User msg length: %d, "
+                         "Bot response length: %d, "
+                         "Processing time: %.2fs",
+                         session_id, len(user_message), len(bot_response), processing_time)
     
     def log_intent_detection(self, session_id, user_message, detected_intents, confidence):
         """Log intent detection results"""
-        self.logger.info(f"Intent detection - Session: {session_id}, "
-                        f"Intents: {detected_intents}, "
-                        f"Confidence: {confidence}")
+        self.logger.info("Intent detection - Session: %s, "
+                         "Intents: %s, "
+                         "Confidence: %s",
+                         session_id, detected_intents, confidence)
     
     def log_document_retrieval(self, session_id, query, documents_found, top_similarity):
         """Log document retrieval results"""
-        self.logger.info(f"Document retrieval - Session: {session_id}, "
-                        f"Query: '{query[:50]}...', "
-                        f"Documents found: {documents_found}, "
-                        f"Top similarity: {top_similarity:.3f}")
+        self.logger.info("Document retrieval - Session: %s, "
+                         "Query: '%.50s...', "
+                         "Documents found: %s, "
+                         "Top similarity: %.3f",
+                         session_id, query, documents_found, top_similarity)
     
     def log_user_data_collection(self, session_id, data_type, value):
         """Log user data collection (privacy-safe)"""
         # Don't log actual values for privacy
-        self.logger.info(f"User data collected - Session: {session_id}, "
-                        f"Type: {data_type}, "
-                        f"Length: {len(str(value)) if value else 0}")
+        self.logger.info("User data collected - Session: %s, "
+                         "Type: %s, "
+                         "Length: %d",
+                         session_id, data_type, len(str(value)) if value else 0)
     
     def log_session_end(self, session_id, duration, message_count, final_status):
         """Log session completion"""
-        self.logger.info(f"Session ended - Session: {session_id}, "
-                        f"Duration: {duration:.1f}min, "
-                        f"Messages: {message_count}, "
-                        f"Status: {final_status}")
\ No newline at end of file
+        self.logger.info("Session ended - Session: %s, "
+                         "Duration: %.1fmin, "
+                         "Messages: %s, "
+                         "Status: %s",
+                         session_id, duration, message_count, final_status)
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Shared model loaders so each model's weights are loaded once per process
+and reused across Streamlit sessions and reruns
+"""
+
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import streamlit as st
+import torch
+from langchain_community.chat_models import ChatOpenAI
+from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer, pipeline
+
+logger = logging.getLogger('sundew_chatbot')
+
+# Exported ONNX models are kept here so the export only happens once
+ONNX_EXPORT_DIR = Path('models/onnx')
+
+# Scored before and after int8 quantization to report the accuracy impact
+QUANTIZATION_CHECK = ("What services do you offer?", ["services", "careers", "company information"])
+
+# CPU inference scales to a handful of intra-op threads; beyond that the
+# small models here mostly pay synchronization cost
+torch.set_num_threads(int(os.getenv('TORCH_NUM_THREADS', min(8, os.cpu_count() or 1))))
+try:
+    torch.set_num_interop_threads(2)
+except RuntimeError:
+    # Only settable before the first inter-op parallel work, e.g. on a module reload
+    pass
+
+@st.cache_resource(show_spinner="Loading embedding model...")
+def get_embedder(model_name, backend='torch', quantization=None):
+    """Return the process-wide SentenceTransformer for model_name"""
+    if backend == 'onnx':
+        if quantization:
+            return _load_quantized_onnx_embedder(model_name, quantization)
+        # Uses the ONNX weights published with the model, exporting if absent
+        return SentenceTransformer(model_name, backend='onnx', tokenizer_kwargs={'use_fast': True})
+    
+    # Half precision where the hardware computes it natively; embeddings are
+    # still returned as float32
+    model_kwargs = {}
+    if torch.cuda.is_available():
+        model_kwargs['torch_dtype'] = torch.float16
+    elif _cpu_supports_bf16():
+        model_kwargs['torch_dtype'] = torch.bfloat16
+    return SentenceTransformer(
+        model_name, model_kwargs=model_kwargs, tokenizer_kwargs={'use_fast': True}
+    )
+
+def _cpu_supports_bf16():
+    """Whether the CPU has native BF16 dot-product instructions (AVX512-BF16/AMX)"""
+    is_supported = getattr(torch.cpu, '_is_avx512_bf16_supported', None)
+    return bool(is_supported and is_supported())
+
+def _load_quantized_onnx_embedder(model_name, quantization):
+    """Load an INT8 dynamically quantized ONNX embedder, quantizing it on first use"""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    
+    # quantization is an optimum preset such as 'avx512_vnni', 'avx2' or 'arm64'
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    export_path = ONNX_EXPORT_DIR / f"{model_name.replace('/', '__')}__qint8_{quantization}"
+    
+    def export(path):
+        model = SentenceTransformer(model_name, backend='onnx', tokenizer_kwargs={'use_fast': True})
+        model.save(str(path))
+        export_dynamic_quantized_onnx_model(model, quantization, str(path))
+    
+    _export_once(export_path, file_name, export)
+    return SentenceTransformer(
+        str(export_path), backend='onnx',
+        model_kwargs={'file_name': file_name}, tokenizer_kwargs={'use_fast': True}
+    )
+
+@st.cache_resource(show_spinner="Loading intent classifier...")
+def get_classifier(model_name, backend='torch', compile_model=False, quantize=False):
+    """Return the process-wide zero-shot classification pipeline for model_name"""
+    if backend == 'onnx':
+        classifier = pipeline(
+            "zero-shot-classification",
+            model=_load_ort_sequence_classifier(model_name),
+            tokenizer=AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        )
+    elif torch.cuda.is_available():
+        # Half precision halves weight traffic; zero-shot labels are unaffected in practice
+        classifier = pipeline(
+            "zero-shot-classification", model=model_name,
+            device=0, torch_dtype=torch.float16
+        )
+    else:
+        classifier = pipeline("zero-shot-classification", model=model_name)
+        if quantize:
+            _quantize_classifier(classifier)
+    
+    if compile_model and backend != 'onnx':
+        # Prompt lengths vary, so compile for dynamic shapes rather than recompiling per length
+        classifier.model = torch.compile(classifier.model, mode='reduce-overhead', dynamic=True)
+    
+    # Warm up once per process so the first user question doesn't pay for
+    # lazy initialization (and, when compiling, for the compilation itself)
+    classifier("warmup", ["greeting", "question"])
+    return classifier
+
+def _quantize_classifier(classifier):
+    """Swap the CPU classifier's Linear layers for int8 dynamically quantized ones"""
+    reference = classifier(*QUANTIZATION_CHECK)
+    classifier.model = torch.ao.quantization.quantize_dynamic(
+        classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    quantized = classifier(*QUANTIZATION_CHECK)
+    
+    drift = max(
+        abs(score - dict(zip(quantized['labels'], quantized['scores']))[label])
+        for label, score in zip(reference['labels'], reference['scores'])
+    )
+    logger.info("Intent model quantized to int8; max score change on sanity check: %.4f", drift)
+
+def _load_ort_sequence_classifier(model_name):
+    """Load an ONNX Runtime sequence classifier, exporting it on first use"""
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    
+    export_path = ONNX_EXPORT_DIR / model_name.replace('/', '__')
+    _export_once(
+        export_path, 'model.onnx',
+        lambda path: ORTModelForSequenceClassification.from_pretrained(model_name, export=True).save_pretrained(path)
+    )
+    return ORTModelForSequenceClassification.from_pretrained(export_path)
+
+def _export_once(export_path, onnx_file, export):
+    """
+    Run export(directory) unless export_path already holds onnx_file. The export
+    is written to a temporary sibling and renamed into place, so an interrupted
+    export is redone on the next start instead of being loaded half-written
+    """
+    if (export_path / onnx_file).exists():
+        return
+    
+    tmp_path = export_path.with_name(f"{export_path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    try:
+        export(tmp_path)
+        shutil.rmtree(export_path, ignore_errors=True)  # An incomplete earlier export
+        os.replace(tmp_path, export_path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def get_chat_llm(model_name, temperature, streaming=False):
+    """Return the shared OpenAI chat model, or None when no API key is configured"""
+    # Checked outside the cached loader so a key added later is picked up on the next run
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    return _load_chat_llm(model_name, temperature, streaming, api_key)
+
+@st.cache_resource
+def _load_chat_llm(model_name, temperature, streaming, api_key):
+    """Return the process-wide OpenAI chat model for these settings"""
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        openai_api_key=api_key,
+        streaming=streaming
+    )
\ No newline at end of file
@@ -6,20 +6,85 @@ import re
 import random
 from datetime import datetime
 
+from utils.keyword_matching import category_bucket, lowered_user_message
+
+# Response formatting patterns, compiled once
+_HEADER_RE = re.compile(r'\n(#{1,6}\s)')
+_DASH_BULLET_RE = re.compile(r'\n-\s')
+_STAR_BULLET_RE = re.compile(r'\n\*\s')
+_EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+
 class ResponseEnhancer:
     """Enhances bot responses with personalization and company-specific elements"""
     
+    _CTA_TEMPLATES = {
+        'service': (
+            "📞 **Ready to discuss your project?** Contact our sales team at {sales_email}",
+            "📋 **Want to see similar projects?** Check out our case studies",
+            "💬 **Need a custom solution?** Let's schedule a consultation"
+        ),
+        'career': (
+            "💼 **Ready to apply?** Send your resume to {careers_email}",
+            "🌟 **Learn about our culture:** Visit our careers page",
+            "📝 **Current openings:** Check our latest job postings"
+        ),
+        'case': (
+            "🎯 **Interested in similar results?** Let's discuss your requirements",
+            "📈 **Want to see more examples?** Browse our complete case studies",
+            "💡 **Have a similar challenge?** Get a free consultation"
+        )
+    }
+    
+    _SOCIAL_PROOF = {
+        'service': (
+            "✨ *Trusted by 100+ businesses across various industries*",
+            "🏆 *Award-winning digital transformation partner*", 
+            "📈 *Average 40% efficiency improvement for our clients*"
+        ),
+        'career': (
+            "🌟 *Rated as 'Great Place to Work' by our employees*",
+            "📚 *Comprehensive training and career development programs*",
+            "🤝 *Collaborative and inclusive work environment*"
+        ),
+        'company': (
+            "🚀 *8+ years of digital innovation excellence*",
+            "🌍 *Serving clients globally with local expertise*",
+            "💡 *Leading digital transformation thought leadership*"
+        )
+    }
+    
+    # Starter templates; only the chosen one is formatted
+    _STARTERS = {
+        'potential_client': (
+            "{greeting}I'm excited to help you find the perfect digital solution for your business. What challenges are you looking to solve?",
+            "{greeting}Welcome to {company_name}! I'd love to learn about your business needs and how we can help you grow.",
+            "{greeting}Great to meet you! What type of digital transformation are you considering for your company?"
+        ),
+        'job_seeker': (
+            "{greeting}Welcome to {company_name}! I'm thrilled you're interested in joining our team. What type of role are you looking for?",
+            "{greeting}Thanks for your interest in careers at {company_name}! Tell me about your background and what excites you about working with us.",
+            "{greeting}I'd love to help you explore opportunities at {company_name}. What skills and experience do you bring?"
+        ),
+        'information_seeker': (
+            "{greeting}I'm here to share information about {company_name} and our digital solutions. What would you like to know?",
+            "{greeting}Welcome! I'm happy to tell you about {company_name}, our services, and our approach to digital transformation.",
+            "{greeting}Great to meet you! What aspects of {company_name} are you most curious about?"
+        ),
+        'general': (
+            "{greeting}I'm {bot_name}, your virtual assistant at {company_name}. How can I help you today?",
+            "{greeting}Welcome to {company_name}! I'm here to answer any questions about our services, company, or opportunities.",
+            "{greeting}Hi there! I'm ready to help with any questions about {company_name}. What can I assist you with?"
+        )
+    }
+    
     def __init__(self, config):
         self.config = config
         self.company_name = config['company_name']
         self.bot_name = config['bot_name']
         self.contact_info = config['contact']
         
-    def build_professional_prompt(self, user_question, user_data=None, intents=None):
-        """Build enhanced prompt for better AI responses"""
-        
-        # Base professional prompt
-        base_prompt = f"""
+        # Base professional prompt; depends only on config, so it is built once
+        self._base_prompt = f"""
         You are {self.bot_name}, a professional business assistant at {self.company_name}.
         
         Your role:
@@ -36,6 +101,24 @@ class ResponseEnhancer:
         - Contact: {self.contact_info['sales_email']} for sales, {self.contact_info['support_email']} for support
         """
         
+        # CTAs embed contact details, so they are formatted once per enhancer
+        contacts = {
+            'sales_email': self.contact_info['sales_email'],
+            'careers_email': self.contact_info.get('careers_email', 'careers@sundewsolutions.com')
+        }
+        self._ctas = {
+            key: tuple(cta.format(**contacts) for cta in ctas)
+            for key, ctas in self._CTA_TEMPLATES.items()
+        }
+        
+        # Per-instance generator so concurrent sessions don't contend on the global one
+        self._rng = random.Random()
+        
+    def build_professional_prompt(self, user_question, user_data=None, intents=None):
+        """Build enhanced prompt for better AI responses"""
+        
+        base_prompt = self._base_prompt
+        
         # Add user context if available
         if user_data:
             user_context = self._build_user_context(user_data)
@@ -137,49 +220,29 @@ class ResponseEnhancer:
         if not intents:
             return response
         
-        ctas = []
-        categories = intents.get('categories', [])
-        
-        for category in categories:
-            if 'service' in category.lower():
-                ctas.extend([
-                    f"📞 **Ready to discuss your project?** Contact our sales team at {self.contact_info['sales_email']}",
-                    f"📋 **Want to see similar projects?** Check out our case studies",
-                    f"💬 **Need a custom solution?** Let's schedule a consultation"
-                ])
-                break
-            elif 'career' in category.lower():
-                ctas.extend([
-                    f"💼 **Ready to apply?** Send your resume to {self.contact_info.get('careers_email', 'careers@sundewsolutions.com')}",
-                    f"🌟 **Learn about our culture:** Visit our careers page",
-                    f"📝 **Current openings:** Check our latest job postings"
-                ])
-                break
-            elif 'case' in category.lower() or 'success' in category.lower():
-                ctas.extend([
-                    f"🎯 **Interested in similar results?** Let's discuss your requirements",
-                    f"📈 **Want to see more examples?** Browse our complete case studies",
-                    f"💡 **Have a similar challenge?** Get a free consultation"
-                ])
-                break
+        # First bucket with CTAs wins, in detected-category order
+        ctas = next((self._ctas[bucket] for bucket in intents.get('buckets', ()) if bucket in self._ctas), ())
         
         # Add one relevant CTA
         if ctas:
-            selected_cta = random.choice(ctas[:2])  # Choose from top 2 most relevant
+            selected_cta = self._pick_top2(ctas)  # Choose from top 2 most relevant
             response += f"\n\n---\n\n{selected_cta}"
         
         return response
     
+    def _pick_top2(self, seq):
+        """Pick one of the first two items without slicing"""
+        return seq[self._rng.randrange(min(2, len(seq)))]
+    
     def _add_branding_elements(self, response, intents):
         """Add subtle branding elements"""
         
         # Add tagline occasionally for brand reinforcement
-        if random.random() < 0.3:  # 30% chance
+        if self._rng.random() < 0.3:  # 30% chance
             response += f"\n\n*{self.company_name}: {self.config['company_tagline']}*"
         
         # Add expertise highlight for service inquiries
-        categories = intents.get('categories', []) if intents else []
-        if any('service' in cat.lower() for cat in categories):
+        if intents and 'service' in intents.get('buckets', ()):
             response += f"\n\n💡 *With 8+ years of digital transformation expertise, {self.company_name} has helped 100+ businesses achieve their goals.*"
         
         return response
@@ -188,14 +251,14 @@ class ResponseEnhancer:
         """Format response for better readability"""
         
         # Ensure proper spacing around headers
-        response = re.sub(r'\n(#{1,6}\s)', r'\n\n\1', response)
+        response = _HEADER_RE.sub(r'\n\n\1', response)
         
         # Ensure proper spacing around bullet points
-        response = re.sub(r'\n-\s', r'\n\n- ', response)
-        response = re.sub(r'\n\*\s', r'\n\n* ', response)
+        response = _DASH_BULLET_RE.sub('\n\n- ', response)
+        response = _STAR_BULLET_RE.sub('\n\n* ', response)
         
         # Clean up multiple newlines
-        response = re.sub(r'\n{3,}', '\n\n', response)
+        response = _EXTRA_NEWLINES_RE.sub('\n\n', response)
         
         # Ensure final response ends cleanly
         response = response.strip()
@@ -210,30 +273,8 @@ class ResponseEnhancer:
         
         greeting = f"Hello {name}! " if name else "Hello! "
         
-        starters = {
-            'potential_client': [
-                f"{greeting}I'm excited to help you find the perfect digital solution for your business. What challenges are you looking to solve?",
-                f"{greeting}Welcome to {self.company_name}! I'd love to learn about your business needs and how we can help you grow.",
-                f"{greeting}Great to meet you! What type of digital transformation are you considering for your company?"
-            ],
-            'job_seeker': [
-                f"{greeting}Welcome to {self.company_name}! I'm thrilled you're interested in joining our team. What type of role are you looking for?",
-                f"{greeting}Thanks for your interest in careers at {self.company_name}! Tell me about your background and what excites you about working with us.",
-                f"{greeting}I'd love to help you explore opportunities at {self.company_name}. What skills and experience do you bring?"
-            ],
-            'information_seeker': [
-                f"{greeting}I'm here to share information about {self.company_name} and our digital solutions. What would you like to know?",
-                f"{greeting}Welcome! I'm happy to tell you about {self.company_name}, our services, and our approach to digital transformation.",
-                f"{greeting}Great to meet you! What aspects of {self.company_name} are you most curious about?"
-            ],
-            'general': [
-                f"{greeting}I'm {self.bot_name}, your virtual assistant at {self.company_name}. How can I help you today?",
-                f"{greeting}Welcome to {self.company_name}! I'm here to answer any questions about our services, company, or opportunities.",
-                f"{greeting}Hi there! I'm ready to help with any questions about {self.company_name}. What can I assist you with?"
-            ]
-        }
-        
-        return random.choice(starters.get(user_type, starters['general']))
+        template = self._rng.choice(self._STARTERS.get(user_type, self._STARTERS['general']))
+        return template.format(greeting=greeting, company_name=self.company_name, bot_name=self.bot_name)
     
     def suggest_next_questions(self, current_topic, conversation_history):
         """Suggest relevant follow-up questions"""
@@ -266,12 +307,13 @@ class ResponseEnhancer:
         }
         
         # Determine current topic from conversation
+        recent_messages = [lowered_user_message(turn) for turn in conversation_history[-3:]]
         topic_key = 'services'  # default
-        if any('career' in turn.get('user', '').lower() for turn in conversation_history[-3:]):
+        if any('career' in message for message in recent_messages):
             topic_key = 'careers'
-        elif any('about' in turn.get('user', '').lower() for turn in conversation_history[-3:]):
+        elif any('about' in message for message in recent_messages):
             topic_key = 'company'
-        elif any(tech in turn.get('user', '').lower() for turn in conversation_history[-3:] 
+        elif any(tech in message for message in recent_messages 
                 for tech in ['technical', 'api', 'integration', 'architecture']):
             topic_key = 'technical'
         
@@ -294,36 +336,11 @@ class ResponseEnhancer:
     def add_social_proof(self, response, intent_categories):
         """Add relevant social proof elements"""
         
-        social_proof_elements = {
-            'services': [
-                "✨ *Trusted by 100+ businesses across various industries*",
-                "🏆 *Award-winning digital transformation partner*", 
-                "📈 *Average 40% efficiency improvement for our clients*"
-            ],
-            'careers': [
-                "🌟 *Rated as 'Great Place to Work' by our employees*",
-                "📚 *Comprehensive training and career development programs*",
-                "🤝 *Collaborative and inclusive work environment*"
-            ],
-            'company': [
-                "🚀 *8+ years of digital innovation excellence*",
-                "🌍 *Serving clients globally with local expertise*",
-                "💡 *Leading digital transformation thought leadership*"
-            ]
-        }
-        
         # Add relevant social proof
         for category in intent_categories:
-            if 'service' in category.lower():
-                proof = random.choice(social_proof_elements['services'])
-                response += f"\n\n{proof}"
-                break
-            elif 'career' in category.lower():
-                proof = random.choice(social_proof_elements['careers'])  
-                response += f"\n\n{proof}"
-                break
-            elif 'company' in category.lower() or 'about' in category.lower():
-                proof = random.choice(social_proof_elements['company'])
+            bucket = category_bucket(category)
+            if bucket in self._SOCIAL_PROOF:
+                proof = self._rng.choice(self._SOCIAL_PROOF[bucket])
                 response += f"\n\n{proof}"
                 break
         
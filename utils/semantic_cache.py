@@ -0,0 +1,90 @@
+"""
+Semantic cache for results of past queries, matched by embedding similarity
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+class SemanticCache:
+    """Returns a stored result when a new query embeds close to a previous one"""
+    
+    def __init__(self, dim, threshold=0.95, max_entries=512, ttl_seconds=7 * 24 * 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        
+        # FAISS ids are entry ids; entries are kept in least-recently-used order
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._entries = OrderedDict()  # entry id -> (timestamp, value)
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    def get(self, embedding):
+        """
+        Look up the result stored for the most similar cached query
+        
+        Args:
+            embedding: L2-normalized query embedding
+        
+        Returns:
+            The cached value, or None if no cached query is similar enough
+        """
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            if self._entries:
+                similarities, ids = self._index.search(query, 1)
+                entry_id = int(ids[0][0])
+                entry = self._entries.get(entry_id)
+                if (entry is not None and similarities[0][0] >= self.threshold
+                        and time.time() - entry[0] < self.ttl_seconds):
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry[1]
+            
+            self.misses += 1
+            return None
+    
+    def put(self, embedding, value):
+        """Store value for the query with this embedding"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            self._evict(time.time())
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = (time.time(), value)
+    
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._index.reset()
+            self._entries.clear()
+    
+    def hit_rate(self):
+        """Fraction of lookups answered from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def _evict(self, now):
+        """Drop expired entries, then least recently used ones until there is room"""
+        stale = {entry_id for entry_id, (timestamp, _) in self._entries.items()
+                 if now - timestamp >= self.ttl_seconds}
+        excess = len(self._entries) - len(stale) - self.max_entries + 1
+        for entry_id in self._entries:
+            if excess <= 0:
+                break
+            if entry_id not in stale:
+                stale.add(entry_id)
+                excess -= 1
+        
+        if stale:
+            for entry_id in stale:
+                del self._entries[entry_id]
+            self._index.remove_ids(np.array(list(stale), dtype=np.int64))
\ No newline at end of file
@@ -3,31 +3,123 @@ Validation utilities for email, phone, and other user inputs
 """
 
 import re
-import streamlit as st
+from functools import lru_cache
+from types import MappingProxyType
+from typing import NamedTuple, Optional
 
-def validate_email(email):
-    """Validate email format"""
-    if not email:
-        return False
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+# Longest user input kept by sanitize_input
+MAX_INPUT_CHARS = 1000
 
-def is_business_email(email):
-    """Check if email is from a business domain (not personal)"""
+# Longest address allowed in the SMTP forward path (RFC 5321)
+MAX_EMAIL_CHARS = 254
+
+# Emails whose checks are memoized; Streamlit reruns revalidate the same input
+EMAIL_CACHE_SIZE = 1024
+
+# Patterns compiled once at import, with ASCII semantics since every format
+# they check is ASCII; validators use fullmatch, so none are anchored. The
+# email domain is bounded and must start and end alphanumeric, which keeps
+# backtracking linear on crafted input
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9](?:[a-zA-Z0-9.-]{0,253}[a-zA-Z0-9])?\.[a-zA-Z]{2,24}', re.ASCII)
+_PHONE_RE = re.compile(
+    r'\+?91[6789]\d{9}'    # Indian mobile
+    r'|\+?1[2-9]\d{9}'     # US phone
+    r'|\+?[1-9]\d{10,14}'  # International
+    r'|[6789]\d{9}',       # Indian mobile without country code
+    re.ASCII
+)
+_HTML_TAG_RE = re.compile(r'<[^>]*>', re.ASCII)
+_SUSPICIOUS_RE = re.compile(r'(?:test|temp|fake|demo)\d*', re.ASCII)
+
+# Separators removed from phone numbers before validation: dashes, brackets
+# and every whitespace character (all of which lie below U+3001)
+_PHONE_STRIP_TABLE = str.maketrans('', '', '-()' + ''.join(
+    char for char in map(chr, range(0x3001)) if char.isspace()
+))
+
+# Free email providers; any other domain counts as a business one
+_PERSONAL_DOMAINS = frozenset({
+    "gmail.com", "yahoo.com", "outlook.com", "hotmail.com",
+    "icloud.com", "aol.com", "protonmail.com", "live.com",
+    "msn.com", "ymail.com", "rediffmail.com", "mail.com"
+})
+
+# Domain types by top-level label, then by second-level label (as in co.uk
+# or com.au) for country-code domains
+_TLD_TYPES = {
+    'com': 'Commercial',
+    'org': 'Organization',
+    'edu': 'Educational',
+    'gov': 'Government',
+    'inc': 'Incorporated',
+    'ltd': 'Limited',
+    'corp': 'Corporation'
+}
+_SECOND_LEVEL_TYPES = {
+    'com': 'Commercial',
+    'org': 'Organization',
+    'edu': 'Educational',
+    'gov': 'Government',
+    'co': 'Company',
+    'ltd': 'Limited'
+}
+
+def _domain_type(domain):
+    """Classify a lowercase domain by its last two labels"""
+    name, _, tld = domain.rpartition('.')
+    domain_type = _TLD_TYPES.get(tld)
+    if domain_type is None and '.' in name:
+        domain_type = _SECOND_LEVEL_TYPES.get(name.rpartition('.')[2])
+    return domain_type or 'Personal'
+
+class EmailInfo(NamedTuple):
+    """Validity and domain details of an email address"""
+    valid: bool
+    domain: str
+    is_business: bool
+    type: Optional[str]  # Domain type, or None when the address is not valid
+
+@lru_cache(maxsize=EMAIL_CACHE_SIZE)
+def parse_email(email):
+    """
+    Validate and classify an email address in one pass
+    
+    Args:
+        email: Email address as entered by the user
+        
+    Returns:
+        EmailInfo; is_business only needs an '@' in the address, while type
+        is only set for valid addresses
+    """
     if not email:
-        return False
+        return EmailInfo(False, '', False, None)
     
-    personal_domains = [
-        "gmail.com", "yahoo.com", "outlook.com", "hotmail.com",
-        "icloud.com", "aol.com", "protonmail.com", "live.com",
-        "msn.com", "ymail.com", "rediffmail.com", "mail.com"
-    ]
+    _, at, domain = email.rpartition('@')
+    domain = domain.lower()
+    is_business = bool(at) and domain not in _PERSONAL_DOMAINS
     
-    try:
-        domain = email.split("@")[1].lower()
-        return domain not in personal_domains
-    except:
+    if not _matches_email_format(email):
+        return EmailInfo(False, domain, is_business, None)
+    return EmailInfo(True, domain, is_business, _domain_type(domain))
+
+def _matches_email_format(email):
+    """Check a non-empty string against the email format"""
+    if len(email) > MAX_EMAIL_CHARS:
+        return False
+    
+    # Cheap structural checks reject most malformed input before the regex runs
+    at = email.find('@')
+    if at < 1 or email.find('.', at) < 0:
         return False
+    return _EMAIL_RE.fullmatch(email) is not None
+
+def validate_email(email):
+    """Validate email format"""
+    return parse_email(email).valid
+
+def is_business_email(email):
+    """Check if email is from a business domain (not personal)"""
+    return parse_email(email).is_business
 
 def validate_phone(phone):
     """Validate phone number format"""
@@ -35,33 +127,41 @@ def validate_phone(phone):
         return True  # Phone is optional
     
     # Remove spaces, dashes, and brackets
-    clean_phone = re.sub(r'[\s\-\(\)]', '', phone)
+    clean_phone = phone.translate(_PHONE_STRIP_TABLE)
     
-    # Check for valid phone patterns
-    patterns = [
-        r'^\+?91[6789]\d{9}$',  # Indian mobile
-        r'^\+?1[2-9]\d{9}$',    # US phone
-        r'^\+?[1-9]\d{10,14}$', # International
-        r'^[6789]\d{9}$'        # Indian mobile without country code
-    ]
+    # Valid numbers are 10 to 15 digits, plus an optional leading '+'
+    if not 10 <= len(clean_phone) <= 16:
+        return False
     
-    return any(re.match(pattern, clean_phone) for pattern in patterns)
+    # Check for valid phone patterns
+    return _PHONE_RE.fullmatch(clean_phone) is not None
 
 def sanitize_input(text):
     """Sanitize user input to prevent basic security issues"""
     if not text:
         return ""
     
-    # Remove potential HTML/script tags
-    text = re.sub(r'<[^>]*>', '', text)
+    # Limit length first, so the cleanup below never scans more than is kept
+    if len(text) > MAX_INPUT_CHARS:
+        # A tag cut at the limit would leave its opening fragment behind; drop
+        # it when the tag closes past the limit, as stripping the full text would
+        tag_start = text.rfind('<', 0, MAX_INPUT_CHARS)
+        if tag_start > text.rfind('>', 0, MAX_INPUT_CHARS) and text.find('>', MAX_INPUT_CHARS) >= 0:
+            text = text[:tag_start]
+        else:
+            text = text[:MAX_INPUT_CHARS]
+        
+        # Imported here so the validators don't load Streamlit on import
+        import streamlit as st
+        st.warning(f"Input was truncated to {MAX_INPUT_CHARS} characters.")
     
-    # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    # Remove potential HTML/script tags; there can be none without a '<'
+    if '<' in text:
+        text = _HTML_TAG_RE.sub('', text)
     
-    # Limit length
-    if len(text) > 1000:
-        text = text[:1000]
-        st.warning("Input was truncated to 1000 characters.")
+    # Remove excessive whitespace; split() treats the same characters as
+    # whitespace that \s does
+    text = ' '.join(text.split())
     
     return text
 
@@ -75,46 +175,18 @@ def validate_company_name(name):
         return False
     
     # Check for suspicious patterns
-    suspicious_patterns = [
-        r'^test\d*$',
-        r'^temp\d*$',
-        r'^fake\d*$',
-        r'^demo\d*$'
-    ]
-    
     name_lower = name.lower().strip()
-    return not any(re.match(pattern, name_lower) for pattern in suspicious_patterns)
+    return _SUSPICIOUS_RE.fullmatch(name_lower) is None
 
+@lru_cache(maxsize=EMAIL_CACHE_SIZE)
 def extract_domain_info(email):
-    """Extract information about the email domain"""
-    if not validate_email(email):
+    """Extract information about the email domain; the result is shared and read-only"""
+    info = parse_email(email)
+    if not info.valid:
         return None
     
-    try:
-        domain = email.split("@")[1].lower()
-        
-        # Common business domains
-        business_indicators = {
-            '.com': 'Commercial',
-            '.org': 'Organization', 
-            '.edu': 'Educational',
-            '.gov': 'Government',
-            '.co.': 'Company',
-            '.inc': 'Incorporated',
-            '.ltd': 'Limited',
-            '.corp': 'Corporation'
-        }
-        
-        domain_type = 'Personal'
-        for indicator, type_name in business_indicators.items():
-            if indicator in domain:
-                domain_type = type_name
-                break
-        
-        return {
-            'domain': domain,
-            'type': domain_type,
-            'is_business': is_business_email(email)
-        }
-    except:
-        return None
\ No newline at end of file
+    return MappingProxyType({
+        'domain': info.domain,
+        'type': info.type,
+        'is_business': info.is_business
+    })
\ No newline at end of file